@@ -2,138 +2,761 @@
 Author: Tim Johns
 Last modified: (6/28/24)
 This program pulls hashes from a given .csv file and prints the virustotal scan results.
-Requirements: The sys, csv and requests modules.
+Requirements: The csv, argparse and requests modules.
 Input: A .csv file that stores hashes in each descending rows in the first column.
+       Rows are read lazily; MD5/SHA1/SHA256 hashes are normalized to lowercase, and
+       duplicate or invalid entries are dropped (and counted in the final report).
 Output: The results of the scan for each hash.
 Example Usage (in terminal):
 ---
-$python3 HashScan.py <path to csv file>
+$python3 HashScan.py
+$python3 HashScan.py <path to csv file> --full-report
+$python3 HashScan.py <path to csv file> --format jsonl -o verdicts.jsonl --workers 8 --rate 1000 --batch-size 25
 ---
+Run without arguments, the scanner prompts for the .csv file and the full report.
+Given a .csv file it runs without prompting and writes text, JSON Lines or CSV
+verdicts (--format) to stdout or --output. For jsonl/csv the final report goes to stderr.
+The scanner can also be driven from Python with scan_file(), which returns a ScanResult.
+Hashes are looked up --batch-size at a time per API request. Requests run on a bounded
+thread pool (--workers) and share a token bucket that keeps the whole scan under the
+per-minute API quota (--rate). Rate-limited (204/429) and 5xx responses are retried
+with exponential backoff, and verdicts are printed as soon as each lookup completes.
+Reports are cached in a local SQLite database (--cache) keyed by the lowercased hash.
+Cached reports older than --refresh-older-than days are fetched again, the cache is
+trimmed to --cache-max-entries by evicting the least recently used hashes, and
+--cache-only answers purely from the cache without touching the API.
+Every completed verdict is appended to a journal (--journal) as it arrives. If a run
+dies part way through, rerunning it with --resume skips the journaled hashes and
+still builds the final report from them.
 """
+import os
+import json
+import time
+import sqlite3
+import random
+import argparse
 import sys
+import threading
 import requests
 import csv
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 
 #Replace with personal VirusTotal API key:
 API_KEY = 'c111f6516b6d00c1c7994ee04870e7e3996182f9954ea9477a24fa984e7e5c84'
 
-#Universal variables used for final tally
-Malware = 0
-MalwareList = []
-Likely_Malware = 0
-LikelyMalwareList = []
-Likely_Clean = 0
-Likely_CleanList = []
+#File report endpoint (can be pointed at a local stub server with --api-url):
+API_URL = 'https://www.virustotal.com/vtapi/v2/file/report'
+
+#Scan engine defaults. The public API allows 4 requests per minute.
+DEFAULT_WORKERS = 4
+DEFAULT_RATE = 4
+DEFAULT_RETRIES = 5
+DEFAULT_BACKOFF = 1.0
+
+#Resources sent per file/report request (4 on the public API, up to 25 on a private key).
+DEFAULT_BATCH_SIZE = 4
+
+#Status codes that are worth retrying. VirusTotal v2 answers 204 when the quota is exceeded.
+RETRY_STATUS = {204, 429, 500, 502, 503, 504}
+
+#Valid hash lengths in hex characters:
+HASH_LENGTHS = {32: 'md5', 40: 'sha1', 64: 'sha256'}
+
+#Journal of completed verdicts, used by --resume:
+DEFAULT_JOURNAL = 'hashscan_journal.jsonl'
+
+#Verdict cache defaults:
+DEFAULT_CACHE = 'hashscan_cache.db'
+DEFAULT_CACHE_DAYS = 7
+DEFAULT_CACHE_MAX_ENTRIES = 1000000
+
+#Token bucket shared by every worker thread so the whole scan respects the per-minute quota.
+#burst defaults to 1, so requests are spread evenly over the minute, and the last minute of
+#requests is also tracked so no sliding 60-second window ever holds more than the quota.
+#close() wakes every waiting thread, so an interrupted scan stops without sending queued requests.
+class TokenBucket:
+
+    def __init__(self, rate_per_minute, burst=None):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = float(burst if burst is not None else 1)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.limit = max(1, int(rate_per_minute))
+        self.window = deque()
+        self.lock = threading.Lock()
+        self.closed = threading.Event()
+
+    #Blocks until a token is available and the last minute has room, then takes it.
+    #Raises ScanError once the bucket has been closed.
+    def acquire(self):
+        while True:
+            if self.closed.is_set():
+                raise ScanError("scan stopped")
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                while self.window and now - self.window[0] >= 60:
+                    self.window.popleft()
+                if len(self.window) >= self.limit:
+                    wait_time = 60 - (now - self.window[0])
+                elif self.tokens >= 1:
+                    self.tokens -= 1
+                    self.window.append(now)
+                    return
+                else:
+                    wait_time = (1 - self.tokens) / self.rate
+            self.closed.wait(wait_time)
+
+    #Waits for seconds (a retry backoff), returning early with a ScanError if the bucket is closed.
+    def sleep(self, seconds):
+        if self.closed.wait(seconds):
+            raise ScanError("scan stopped")
+
+    def close(self):
+        self.closed.set()
+
+
+#Raised when a lookup still fails after all of its retries.
+class ScanError(Exception):
+    pass
+
+
+#Request counters and per-request latencies, filled in by get_file_reports when passed in.
+#Used by hashscan_bench.py to measure throughput and quota efficiency.
+class ScanMetrics:
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.retries = 0
+        self.latencies = []
+
+    def record(self, seconds, retry):
+        with self.lock:
+            self.requests += 1
+            self.retries += retry
+            self.latencies.append(seconds)
+
+
+#One requests.Session per worker thread so connections are reused between lookups.
+_local = threading.local()
+
+def _get_session():
+    session = getattr(_local, 'session', None)
+    if session is None:
+        session = requests.Session()
+        _local.session = session
+    return session
+
+
+#Works out how long to wait before the next attempt, honouring Retry-After when the server sends it.
+def _backoff_delay(response, attempt, backoff):
+    if response is not None:
+        retry_after = response.headers.get('Retry-After')
+        if retry_after and retry_after.isdigit():
+            return float(retry_after)
+    return backoff * (2 ** attempt) * (0.5 + random.random() / 2)
+
+
+#Gets the file reports for a batch of hashes via the virustotal api in one request.
+#The v2 endpoint takes a comma-separated list of resources and answers with one report per resource.
+#Returns a dictionary of {normalized hash : report}. Only entries the server actually sent are used as
+#reports. Hashes missing from the answer (the key allows fewer resources per request, or the server sent an
+#error object) are asked for again in smaller batches, and a hash still missing on its own maps to a ScanError.
+def get_file_reports(file_hashes, limiter=None, api_url=None, retries=DEFAULT_RETRIES, backoff=DEFAULT_BACKOFF,
+                     metrics=None):
+    url = api_url or API_URL
+    keys = [file_hash.strip().lower() for file_hash in file_hashes]
+    params = {'apikey': API_KEY, 'resource': ','.join(keys)}
+    session = _get_session()
+    for attempt in range(retries + 1):
+        if limiter is not None:
+            limiter.acquire()
+        response = None
+        started = time.perf_counter()
+        try:
+            response = session.get(url, params=params, timeout=30)
+        except requests.RequestException as e:
+            error = e
+        else:
+            if response.status_code not in RETRY_STATUS:
+                break
+            error = f"HTTP {response.status_code}"
+        finally:
+            if metrics is not None:
+                metrics.record(time.perf_counter() - started, attempt > 0)
+        if attempt == retries:
+            raise ScanError(f"{','.join(keys)}: {error}")
+        if limiter is not None:
+            limiter.sleep(_backoff_delay(response, attempt, backoff))
+        else:
+            time.sleep(_backoff_delay(response, attempt, backoff))
+    response.raise_for_status()
+
+    #A single resource comes back as one object, several come back as a list in request order.
+    answer = response.json()
+    if isinstance(answer, dict):
+        answer = [answer]
+
+    reports = {}
+    for position, report in enumerate(answer):
+        if not isinstance(report, dict) or 'response_code' not in report:
+            continue
+        resource = str(report.get('resource', '')).strip().lower()
+        #Without a usable resource field, request order is only trusted when every resource was answered:
+        if resource not in keys and len(answer) == len(keys):
+            resource = keys[position]
+        if resource in keys:
+            reports[resource] = report
+
+    missing = [key for key in keys if key not in reports]
+    if len(missing) == len(keys) == 1:
+        reports[keys[0]] = ScanError(f"{keys[0]}: no report in the answer")
+    elif missing:
+        #Ask again at most as many at a time as were answered (half the batch if none were):
+        size = max(1, min(len(reports), len(keys) // 2) if reports else len(keys) // 2)
+        for start in range(0, len(missing), size):
+            part = missing[start:start + size]
+            try:
+                reports.update(get_file_reports(part, limiter, api_url, retries, backoff, metrics))
+            except (ScanError, requests.RequestException, ValueError) as e:
+                reports.update((key, ScanError(str(e))) for key in part)
+    return reports
 
 
 #Gets the file report for a given hash via the virustotal api:
 #Returns the json response to be analyzed.
-def get_file_report(file_hash):
-    url = f'https://www.virustotal.com/vtapi/v2/file/report'
-    params = {'apikey': API_KEY, 'resource': file_hash}
-    response = requests.get(url, params=params)
-    #If no response was found, return 0: 
-    if len(response.text) < 100:
-        return 0
-    return response.json()
+def get_file_report(file_hash, limiter=None, api_url=None, retries=DEFAULT_RETRIES, backoff=DEFAULT_BACKOFF):
+    report = get_file_reports([file_hash], limiter, api_url, retries, backoff)[file_hash.strip().lower()]
+    if isinstance(report, ScanError):
+        raise report
+    return report
 
 
-#Pulls all the hashes from the .csv file and puts them in a list.
-def read_csv_first_column(csv_file):
-    items = []
+#On-disk cache of file reports, keyed by the normalized (stripped, lowercased) hash.
+#Stores the raw report, its scan_date, when it was fetched and when it was last used.
+class VerdictCache:
+
+    def __init__(self, path=DEFAULT_CACHE, max_age_days=DEFAULT_CACHE_DAYS, max_entries=DEFAULT_CACHE_MAX_ENTRIES):
+        self.max_age = max_age_days * 86400 if max_age_days is not None else None
+        self.max_entries = max_entries
+        self.writes = 0
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("""CREATE TABLE IF NOT EXISTS reports (
+                                 hash TEXT PRIMARY KEY,
+                                 report TEXT NOT NULL,
+                                 scan_date TEXT,
+                                 fetched_at REAL NOT NULL,
+                                 last_used REAL NOT NULL)""")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS reports_last_used ON reports (last_used)")
+
+    @staticmethod
+    def key(file_hash):
+        return file_hash.strip().lower()
+
+    #Returns the cached report, or None if the hash is missing or older than the staleness limit.
+    def get(self, file_hash, allow_stale=False):
+        key = self.key(file_hash)
+        row = self.conn.execute("SELECT report, fetched_at FROM reports WHERE hash = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        now = time.time()
+        if not allow_stale and self.max_age is not None and now - row[1] > self.max_age:
+            return None
+        self.conn.execute("UPDATE reports SET last_used = ? WHERE hash = ?", (now, key))
+        self._tick()
+        return json.loads(row[0])
+
+    def put(self, file_hash, report):
+        now = time.time()
+        scan_date = report.get('scan_date') if isinstance(report, dict) else None
+        self.conn.execute("INSERT OR REPLACE INTO reports VALUES (?, ?, ?, ?, ?)",
+                          (self.key(file_hash), json.dumps(report), scan_date, now, now))
+        self._tick()
+
+    #Commits and trims the cache every 1000 writes so lookups stay inside one transaction.
+    def _tick(self):
+        self.writes += 1
+        if self.writes % 1000 == 0:
+            self.evict()
+            self.conn.commit()
+
+    #Drops the least recently used hashes once the cache grows past max_entries.
+    def evict(self):
+        if not self.max_entries:
+            return
+        count = self.conn.execute("SELECT COUNT(*) FROM reports").fetchone()[0]
+        if count > self.max_entries:
+            self.conn.execute("""DELETE FROM reports WHERE hash IN
+                                 (SELECT hash FROM reports ORDER BY last_used LIMIT ?)""",
+                              (count - self.max_entries,))
+
+    def close(self):
+        self.evict()
+        self.conn.commit()
+        self.conn.close()
+
+
+#Looks up every hash on a bounded thread pool and yields (hash, report) pairs as they complete.
+#Hashes are grouped into batches of batch_size resources per request, and at most 2 * workers
+#requests are queued at a time, so hashes can be fed in lazily.
+#Failed lookups are yielded with a ScanError in place of the report.
+#If a VerdictCache is given, cached reports are yielded straight away and fresh ones are stored;
+#with cache_only=True the API is never called and uncached hashes come back as a ScanError.
+#If the scan is interrupted (an exception such as KeyboardInterrupt, or the generator being closed),
+#queued requests are cancelled and waiting workers are woken, so no further requests are sent.
+def scan_hashes(hashes, workers=DEFAULT_WORKERS, rate=DEFAULT_RATE, api_url=None, retries=DEFAULT_RETRIES,
+                backoff=DEFAULT_BACKOFF, cache=None, cache_only=False, batch_size=DEFAULT_BATCH_SIZE, metrics=None):
+    limiter = TokenBucket(rate) if rate else None
+    hashes = iter(hashes)
+    batch = []
+    pool = ThreadPoolExecutor(max_workers=workers)
+    try:
+        pending = {}
+
+        def submit():
+            pending[pool.submit(get_file_reports, list(batch), limiter, api_url, retries, backoff, metrics)] = list(batch)
+            batch.clear()
+
+        #Tops up the queue of in-flight requests from the input.
+        #Returns the results that could be answered without the API.
+        def fill():
+            ready = []
+            for file_hash in hashes:
+                if cache is not None:
+                    report = cache.get(file_hash, allow_stale=cache_only)
+                    if report is not None:
+                        ready.append((file_hash, report))
+                        continue
+                    if cache_only:
+                        ready.append((file_hash, ScanError(f"{file_hash}: not in cache")))
+                        continue
+                batch.append(file_hash)
+                if len(batch) >= batch_size:
+                    submit()
+                if len(pending) >= 2 * workers or len(ready) >= 1000:
+                    return ready
+            #The input is used up, so send whatever is left as a final, smaller batch.
+            if batch:
+                submit()
+            return ready
+
+        while True:
+            ready = fill()
+            yield from ready
+            if not pending:
+                if ready:
+                    continue
+                break
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                file_hashes = pending.pop(future)
+                try:
+                    reports = future.result()
+                except (ScanError, requests.RequestException, ValueError) as e:
+                    for file_hash in file_hashes:
+                        yield file_hash, ScanError(str(e))
+                    continue
+                for file_hash in file_hashes:
+                    report = reports[file_hash.strip().lower()]
+                    if cache is not None and not isinstance(report, ScanError):
+                        cache.put(file_hash, report)
+                    yield file_hash, report
+    except BaseException:
+        if limiter is not None:
+            limiter.close()
+        pool.shutdown(wait=False, cancel_futures=True)
+        raise
+    pool.shutdown()
+
+
+#Lazily yields the first column of every non-empty row in the .csv file.
+def iter_csv_first_column(csv_file):
     with open(csv_file, 'r', newline='') as file:
         reader = csv.reader(file)
         for row in reader:
             if row:  # Check if the row is not empty
-                items.append(row[0])  # Add the first column item to the list
-    return items
+                yield row[0]
+
+
+#Pulls all the hashes from the .csv file and puts them in a list.
+def read_csv_first_column(csv_file):
+    return list(iter_csv_first_column(csv_file))
+
+
+#Returns the hash stripped and lowercased, or None if it isn't an MD5, SHA1 or SHA256 hex digest.
+def normalize_hash(value):
+    value = value.strip().lower()
+    if len(value) not in HASH_LENGTHS:
+        return None
+    try:
+        bytes.fromhex(value)
+    except ValueError:
+        return None
+    return value
+
+
+#Counts of what happened to the rows read from the .csv file.
+class IngestStats:
+
+    def __init__(self):
+        self.read = 0
+        self.unique = 0
+        self.duplicates = 0
+        self.invalid = 0
+        self.resumed = 0
+
+
+#Normalizes the incoming hashes and drops invalid entries and repeats as they stream past.
+#Seen hashes are kept as raw digest bytes, which is about a third of the size of the hex strings.
+def unique_hashes(values, stats=None):
+    if stats is None:
+        stats = IngestStats()
+    seen = set()
+    for value in values:
+        stats.read += 1
+        file_hash = normalize_hash(value)
+        if file_hash is None:
+            stats.invalid += 1
+            continue
+        digest = bytes.fromhex(file_hash)
+        if digest in seen:
+            stats.duplicates += 1
+            continue
+        seen.add(digest)
+        stats.unique += 1
+        yield file_hash
+
+#Makes the verdict for a file report. Returns None for reports of files that are not in the database.
+def classify_report(report):
+    if report['response_code'] != 1:
+        return None
+    ratio = report['positives'] / report['total'] if report['total'] else 0
+    #Conditional statements used to make verdict about the file.
+    if ratio >= 0.5:
+        return "MALWARE"
+    elif ratio == 0:
+        return "LIKELY CLEAN"
+    return "LIKELY MALWARE"
+
+
+#Collects the verdicts of a scan, split by category, along with the ingestion counts.
+class ScanResult:
+
+    def __init__(self):
+        self.stats = IngestStats()
+        self.malware = []
+        self.likely_malware = []
+        self.likely_clean = []
+        self.not_found = []
+        self.failed = []
+
+    #Files the hash under its verdict (None means the file was not in the database).
+    def add(self, hash, verdict):
+        if verdict == "MALWARE":
+            self.malware.append(hash)
+        elif verdict == "LIKELY CLEAN":
+            self.likely_clean.append(hash)
+        elif verdict == "LIKELY MALWARE":
+            self.likely_malware.append(hash)
+        else:
+            self.not_found.append(hash)
+
+    @property
+    def found(self):
+        return len(self.malware) + len(self.likely_malware) + len(self.likely_clean)
+
+
+#Append-only record of every completed lookup, one JSON object per line.
+#Each line is flushed as soon as it is written, so a crashed or interrupted run can be resumed from it.
+class ScanJournal:
+
+    def __init__(self, path, resume=False):
+        self.path = path
+        self.done = self.load(path) if resume else {}
+        torn = resume and self.torn(path)
+        self.file = open(path, 'a' if resume else 'w', encoding='utf-8')
+        #Starts a fresh line after a torn one, so the next record is not glued onto the fragment:
+        if torn:
+            self.file.write("\n")
+
+    #Whether the file ends part way through a line (the last write was cut short by a crash).
+    @staticmethod
+    def torn(path):
+        try:
+            with open(path, 'rb') as file:
+                if file.seek(0, os.SEEK_END) == 0:
+                    return False
+                file.seek(-1, os.SEEK_END)
+                return file.read(1) != b"\n"
+        except FileNotFoundError:
+            return False
+
+    #Reads the verdicts of a previous run as {hash : verdict}. A torn last line from a crash is ignored.
+    @staticmethod
+    def load(path):
+        done = {}
+        try:
+            with open(path, 'r', encoding='utf-8') as file:
+                for line in file:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue
+                    done[entry['hash']] = entry['verdict']
+        except FileNotFoundError:
+            pass
+        return done
+
+    def record(self, hash, report):
+        entry = {'hash': hash, 'verdict': classify_report(report), 'scan_date': report.get('scan_date'),
+                 'positives': report.get('positives'), 'total': report.get('total')}
+        self.file.write(json.dumps(entry) + "\n")
+        self.file.flush()
+
+    def close(self):
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.file.close()
+
+
+#Skips the hashes that a previous run already finished, counting them as resumed.
+def skip_journaled(hashes, journal, stats):
+    for file_hash in hashes:
+        if file_hash in journal.done:
+            stats.resumed += 1
+            continue
+        yield file_hash
+
 
 #Prints the results from the hash results:
-def print_Verdict(report, hash, results):
-    global Likely_Malware, Malware, Likely_Clean
+def print_Verdict(report, hash, results, out=None):
+    out = out or sys.stdout
     # Print the results
-    print("\n------------------------------------------\n")
-    print("Hash: " + hash)
-
-    if report['response_code'] == 1:
-        print(f"Scan date: {report['scan_date']}")
-        print("Positives / Total: {}/{}".format(report['positives'], report['total']))
-        
-        #Conditional statements used to make verdict about the file.
-        if (report['positives'] / report['total'] >= 0.5):
-            Malware += 1
-            MalwareList.append(hash)
-            print("Verdict: MALWARE")
-        elif (report['positives'] / report['total'] == 0):
-            Likely_Clean += 1
-            Likely_CleanList.append(hash)
-            print("Verdict: LIKELY CLEAN")
-        else:
-            print("Verdict: LIKELY MALWARE")
-            Likely_Malware += 1
-            LikelyMalwareList.append(hash)
+    print("\n------------------------------------------\n", file=out)
+    print("Hash: " + hash, file=out)
+
+    if isinstance(report, ScanError):
+        print(f"Lookup failed: {report}", file=out)
+
+    elif report['response_code'] == 1:
+        print(f"Scan date: {report['scan_date']}", file=out)
+        print("Positives / Total: {}/{}".format(report['positives'], report['total']), file=out)
+        print(f"Verdict: {classify_report(report)}", file=out)
 
         #Prints the full results, if the user wants to see them.
         if results == True: 
-            print("\nFull Scan results:\n")
+            print("\nFull Scan results:\n", file=out)
             for antivirus, result in report['scans'].items():
-                print(f"{antivirus}: {result['result']}")
+                print(f"{antivirus}: {result['result']}", file=out)
 
     else:
-        print("File not found in VirusTotal database.")
+        print("File not found in VirusTotal database.", file=out)
+
+
+#Once the scan is complete, print a final report utilizing the combined totals in each category:
+def print_final_report(result, out=None):
+    out = out or sys.stdout
+    stats = result.stats
+    print("*"*42, file=out)
+    print("\nFinal Report:\n", file=out)
+    print(f"Total Scans: {stats.unique}", file=out)
+    print(f"Duplicate hashes skipped: {stats.duplicates}", file=out)
+    print(f"Invalid entries skipped: {stats.invalid}", file=out)
+    if stats.resumed:
+        print(f"Verdicts resumed from journal: {stats.resumed}", file=out)
+    print(f"\nHashes Found: {result.found}", file=out)
+    print(f"Hashes not in database: {len(result.not_found)}", file=out)
+    if result.failed:
+        print(f"Lookups failed: {len(result.failed)}", file=out)
+    for title, hashes in (("Malware files detected", result.malware),
+                          ("Likely malware files detected", result.likely_malware),
+                          ("Likely clean files detected", result.likely_clean)):
+        print(f"\n{title}: {len(hashes)}", file=out)
+        for current in hashes:
+            print(current, file=out)
+    print("\n"+"*"*42, file=out)
+
+
+#Flattens a report into the fields written by the JSON Lines and CSV output formats.
+def verdict_record(hash, report, full_report=False):
+    if isinstance(report, ScanError):
+        return {'hash': hash, 'verdict': 'ERROR', 'scan_date': None, 'positives': None, 'total': None,
+                'error': str(report)}
+    record = {'hash': hash, 'verdict': classify_report(report) or 'NOT FOUND', 'scan_date': report.get('scan_date'),
+              'positives': report.get('positives'), 'total': report.get('total'), 'error': None}
+    if full_report:
+        record['scans'] = {antivirus: result['result'] for antivirus, result in report.get('scans', {}).items()}
+    return record
+
+
+#Writes the human readable per-hash banners (the original output).
+class TextWriter:
+
+    def __init__(self, out, full_report=False):
+        self.out = out
+        self.full_report = full_report
+
+    def write(self, hash, report):
+        print_Verdict(report, hash, self.full_report, self.out)
+
+    def finish(self, result):
+        print("\n------------------------------------------\n", file=self.out)
+        print_final_report(result, self.out)
+
+
+#Writes one JSON object per hash.
+class JsonLinesWriter:
+
+    def __init__(self, out, full_report=False):
+        self.out = out
+        self.full_report = full_report
+
+    def write(self, hash, report):
+        self.out.write(json.dumps(verdict_record(hash, report, self.full_report)) + "\n")
+
+    def finish(self, result):
+        print_final_report(result, sys.stderr)
+
+
+#Writes one CSV row per hash. With the full report, detections go in one "engine:result;..." column.
+class CsvWriter:
+
+    FIELDS = ['hash', 'verdict', 'scan_date', 'positives', 'total', 'error']
+
+    def __init__(self, out, full_report=False):
+        self.out = out
+        self.full_report = full_report
+        self.writer = csv.writer(out)
+        self.writer.writerow(self.FIELDS + (['scans'] if full_report else []))
+
+    def write(self, hash, report):
+        record = verdict_record(hash, report, self.full_report)
+        row = [record[field] for field in self.FIELDS]
+        if self.full_report:
+            row.append(';'.join(f"{antivirus}:{result}" for antivirus, result in record.get('scans', {}).items()))
+        self.writer.writerow(row)
+
+    def finish(self, result):
+        print_final_report(result, sys.stderr)
+
+
+WRITERS = {'text': TextWriter, 'jsonl': JsonLinesWriter, 'csv': CsvWriter}
+
+
+#Scans every hash in a .csv file and returns a ScanResult.
+#on_result(hash, report) is called from the calling thread as each lookup completes;
+#report is a ScanError if the lookup failed. Pass cache_path=None or journal_path=None to turn those off.
+def scan_file(csv_file, on_result=None, workers=DEFAULT_WORKERS, rate=DEFAULT_RATE, batch_size=DEFAULT_BATCH_SIZE,
+              retries=DEFAULT_RETRIES, api_url=None, cache_path=DEFAULT_CACHE, cache_only=False,
+              cache_days=DEFAULT_CACHE_DAYS, cache_max_entries=DEFAULT_CACHE_MAX_ENTRIES,
+              journal_path=DEFAULT_JOURNAL, resume=False):
+    if cache_only and cache_path is None:
+        raise ValueError("cache_only needs a cache_path")
+    result = ScanResult()
+
+    #Streams the hashes from the csv_file, dropping invalid and repeated entries as they are read.
+    items = unique_hashes(iter_csv_first_column(csv_file), result.stats)
+
+    #Opens the journal. When resuming, the finished verdicts go straight into the result and their hashes are skipped.
+    journal = None
+    if journal_path is not None:
+        journal = ScanJournal(journal_path, resume=resume)
+        for hash, verdict in journal.done.items():
+            result.add(hash, verdict)
+        items = skip_journaled(items, journal, result.stats)
+
+    cache = None
+    if cache_path is not None:
+        cache = VerdictCache(cache_path, cache_days, cache_max_entries)
+
+    #Looks up every hash concurrently, handing each report on as it comes back.
+    scan = scan_hashes(items, workers=workers, rate=rate, api_url=api_url, retries=retries,
+                       cache=cache, cache_only=cache_only, batch_size=batch_size)
+    try:
+        for hash, report in scan:
+            if isinstance(report, ScanError):
+                result.failed.append(hash)
+            else:
+                result.add(hash, classify_report(report))
+                if journal is not None:
+                    journal.record(hash, report)
+            if on_result is not None:
+                on_result(hash, report)
+    finally:
+        #Stops the scan straight away if this loop was interrupted:
+        scan.close()
+        if journal is not None:
+            journal.close()
+        if cache is not None:
+            cache.close()
+    return result
+
 
 def main():
 
-    #Prints Opening Banner:
-    print("\n\n" + (42*"*") + "\n\n")
-    print("Welcome to VirusTotal .csv Scanner!")
+    #Parse the command-line arguments:
+    parser = argparse.ArgumentParser(description="VirusTotal .csv Scanner")
+    parser.add_argument('csv_file', nargs='?', help="CSV file with one hash per row in the first column (prompts if left out)")
+    parser.add_argument('--full-report', action='store_true', help="Include every antivirus result for each hash")
+    parser.add_argument('--format', choices=sorted(WRITERS), default='text', help="Output format for the verdicts")
+    parser.add_argument('-o', '--output', help="Write the verdicts to this file instead of stdout")
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS, help="Number of concurrent lookups")
+    parser.add_argument('--rate', type=int, default=DEFAULT_RATE, help="API requests allowed per minute (0 = unlimited)")
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE, help="Hashes sent per API request")
+    parser.add_argument('--retries', type=int, default=DEFAULT_RETRIES, help="Retries for rate-limited or failed lookups")
+    parser.add_argument('--api-url', default=API_URL, help="File report endpoint (e.g. a local stub server)")
+    parser.add_argument('--cache', default=DEFAULT_CACHE, help="SQLite file used to cache reports")
+    parser.add_argument('--no-cache', action='store_true', help="Do not read or write the report cache")
+    parser.add_argument('--cache-only', action='store_true', help="Only answer from the cache, never call the API")
+    parser.add_argument('--refresh-older-than', type=float, default=DEFAULT_CACHE_DAYS, metavar='DAYS',
+                        help="Fetch cached reports again once they are older than this many days")
+    parser.add_argument('--cache-max-entries', type=int, default=DEFAULT_CACHE_MAX_ENTRIES,
+                        help="Evict the least recently used hashes beyond this many entries")
+    parser.add_argument('--journal', default=DEFAULT_JOURNAL, help="File that records every completed verdict")
+    parser.add_argument('--resume', action='store_true', help="Skip hashes already in the journal and include them in the report")
+    args = parser.parse_args()
+    if args.cache_only and args.no_cache:
+        parser.error("--cache-only needs the cache; drop --no-cache")
+
+    seeReport = args.full_report
+    if args.csv_file is None:
+        #Prints Opening Banner:
+        print("\n\n" + (42*"*") + "\n\n")
+        print("Welcome to VirusTotal .csv Scanner!")
 
-    #Checks to ensure that the user included the .csv filepath as an argument. If they did not, it prompts the user.
-    if len(sys.argv) != 2:
+        #No .csv filepath was given as an argument, so run interactively and prompt the user.
         csv_file = input("\n\nPlease enter the full filepath for the .csv file you wish to scan: ")
-        
+
+        #Prompt the user to see whether they would like to see the full report:
+        preference = input("\n\n\nWould you like to see the full report for each hash?\nEnter Y/N: ")
+        if preference.upper() == "Y":
+            seeReport = True
     else:
         #Pulls the csv_file from the command-line argument.
-        csv_file = sys.argv[1]
-    
-
-    #Places all the hashes from the csv_file into a list called items.
-    items = read_csv_first_column(csv_file)
-
-
-    #Prompt the user to see whether they would like to see the full report:
-    seeReport = False
-    preference = input("\n\n\nWould you like to see the full report for each hash?\nEnter Y/N: ")
-    if preference.upper() == "Y":
-        seeReport = True
-
-    print(f"\n\nScanning {len(items)} hashes from {csv_file}...\n")
-
-    #Iterates through every hash in the items list.
-    for hash in items:
-        #Gets the report from VirusTotal for the current hash, and feeds it into the print function.
-        print_Verdict(get_file_report(hash), hash, seeReport)
-    print("\n------------------------------------------\n")
-
-    #Once the scan is complete, print a final report utilizing the combined totals in each category:
-    print("*"*42)
-    print("\nFinal Report:\n")
-    print(f"Total Scans: {len(items)}")
-    print(f"\nHashes Found: {Malware + Likely_Malware + Likely_Clean}")
-    print(f"Hashes not in database: {len(items) - (Malware + Likely_Malware + Likely_Clean)}")
-    print(f"\nMalware files detected: {Malware}")
-    if len(MalwareList) > 0:
-        for current in MalwareList:
-            print(current)
-    print(f"\nLikely malware files detected: {Likely_Malware}")
-    if len(LikelyMalwareList) > 0:
-        for current in LikelyMalwareList:
-            print(current)
-    print(f"\nLikely clean files detected: {Likely_Clean}")
-    if len(Likely_CleanList) > 0:
-        for current in Likely_CleanList:
-            print(current)
-    print("\n"+"*"*42)
+        csv_file = args.csv_file
+
+    #Verdicts go through a large write buffer so output doesn't hold up the scan.
+    if args.output:
+        out = open(args.output, 'w', newline='', encoding='utf-8', buffering=1 << 20)
+    else:
+        out = sys.stdout
+    writer = WRITERS[args.format](out, seeReport)
+    if args.format == 'text':
+        print(f"\n\nScanning hashes from {csv_file}...\n", file=out)
+
+    try:
+        result = scan_file(csv_file, on_result=writer.write, workers=args.workers, rate=args.rate,
+                           batch_size=args.batch_size, retries=args.retries, api_url=args.api_url,
+                           cache_path=None if args.no_cache else args.cache, cache_only=args.cache_only,
+                           cache_days=args.refresh_older_than, cache_max_entries=args.cache_max_entries,
+                           journal_path=args.journal, resume=args.resume)
+        writer.finish(result)
+    finally:
+        if out is not sys.stdout:
+            out.close()
 
 
 if __name__ == "__main__":
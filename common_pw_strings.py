@@ -5,27 +5,55 @@ from a .CSV file of passwords (one per row, column 1 only).
 Syntax: 
     python3 common_pw_strings.py <name or path to .csv password file>
     Example: python3 common_pw_strings.py ./crackable_pwds.csv
+    Options: --ner all|prefilter|off      -> named entity recognition on every row (default), only on rows
+                                             with a capitalized word, or not at all
+             --ner-processes N            -> run spaCy on N processes (rows are batched through nlp.pipe)
+             --counts exact|sketch        -> exact counts (default), or Count-Min sketches with heavy-hitter
+                                             tracking in --sketch-memory MiB (masks included with --structure),
+                                             for dumps too big for RAM
+             --workers N                  -> count byte ranges of the file on N processes (same output)
+             --shard I/N --save-counts F  -> count only part I of N and save the counts, e.g. on another host
+             --merge-counts F [F ...]     -> combine saved counts and write the outputs without reading a CSV
+             --store [DB]                 -> fold the counts into a SQLite store (default pw_stats.db) that
+                                             remembers ingested files (only the new rows of a file that was
+                                             appended to are counted); the outputs cover everything stored
+             --structure                  -> also tabulate masks, lengths, trailing digits/years and character
+                                             sets in the same pass, and write the top masks to masks.hcmask
+    The word list is compiled once into a lexicon cached under ~/.cache/common_pw_strings (--lexicon to
+    choose the file, --rebuild-lexicon to force a rebuild); the default cache name follows the nltk corpus
+    file's size and mtime, so a changed corpus is recompiled. spaCy, nltk and its corpus are only imported
+    or loaded when needed; a cached lexicon is found by stat()ing the corpus in nltk's data directories.
+    The time spent reading, extracting words, running NER and counting is printed at the end.
 Output:
     frequent_passwords.txt -> .txt file containing the frequently occurring passwords disovered (one per line)
     frequent_words.txt -> .txt file containing the frequntly occurring words discovered (one per line)
+    masks.hcmask -> the most common hashcat masks, most common first, with --structure (hashcat -a 3 masks.hcmask)
     results.txt -> file if you pipe output to a .txt file. (Optional)
 """
 import argparse
 import csv
-import nltk
-import spacy
-from nltk.corpus import words
+import io
+import os
+import re
+import heapq
+import string
+import sys
+import time
+import pickle
+import sqlite3
+import hashlib
+import marshal
+from array import array
+from collections import Counter, deque
+from itertools import repeat
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from tabulate import tabulate
 from tqdm import tqdm
 
-# Download the words corpus if not already downloaded
-nltk.download('words')
-
-# Load the words corpus
-word_list = set(words.words())
-
-# Load SpaCy model
-nlp = spacy.load('en_core_web_sm')
+# nltk and spaCy are only imported, and the word list and model only loaded, when first needed
+# (see get_word_list and get_nlp); module.word_list and module.nlp still work through __getattr__
+_word_list = None
+_nlp = None
 
 # Specific names and words to allow
 specific_terms = {
@@ -39,8 +67,251 @@ exclusions = {
     'in', 'at', 'a', 'for', 'to', 'that', 'an', 'ower', 'ember', 'utum', 'wint', 'inter', 'gree', 'reen', 'rist', 'ring', 'tobe', 'yell', 'rang', 'harl', 'shin', 'bing', 'lower', 'ring', 'elle', 'char'
 }
 
+# Named entity stage: entity labels kept, pipeline components the NER needs (everything else is
+# disabled), rows per nlp.pipe batch, and the cheap test rows must pass with --ner prefilter
+NER_LABELS = {'PERSON', 'ORG', 'GPE', 'LOC'}
+NER_COMPONENTS = {'tok2vec', 'ner'}
+NER_BATCH_SIZE = 1000
+NER_PREFILTER = re.compile(r'[A-Z][a-z]{2,}')
+
+# Stages timed by process_csv
+STAGES = ('read', 'words', 'ner', 'count', 'structure')
+
+# Structure statistics (--structure): hashcat mask class of every ASCII character (anything else is
+# ?b, one per UTF-8 byte), class names for the character-set composition, the mask file written
+# for mask attacks and how many masks go in it, rows shown in each printed table, and rows
+# classified per batch
+MASK_CLASSES = {**dict.fromkeys(string.ascii_lowercase, 'l'), **dict.fromkeys(string.ascii_uppercase, 'u'),
+                **dict.fromkeys(string.digits, 'd'), **dict.fromkeys(string.punctuation + ' ', 's')}
+CHARSET_NAMES = (('l', 'lower'), ('u', 'upper'), ('d', 'digit'), ('s', 'special'), ('b', 'other'))
+MASK_FILE = 'masks.hcmask'
+MASK_TOP = 100
+STRUCTURE_ROWS = 10
+STRUCTURE_BATCH = 1000
+
+# Bounded-memory counting (--counts sketch): default MiB for both sketches together, rows per
+# Count-Min table, and how many heavy hitters each sketch keeps exact names for
+SKETCH_MEMORY = 64
+SKETCH_DEPTH = 4
+SKETCH_TRACKED = 1000
+
+# The progress bar is moved on every PROGRESS_BYTES bytes read
+PROGRESS_BYTES = 1 << 20
+
+# Format version of the files written by --save-counts
+COUNTS_VERSION = 1
+
+# Persistent count store (--store): default database, and bytes hashed from each end of a
+# dump to recognise it when it is offered again
+DEFAULT_STORE = 'pw_stats.db'
+FINGERPRINT_BYTES = 1 << 16
+
+# Compiled lexicons (the WordMatcher automaton) are cached here, one file per min_length and
+# set of specific terms and exclusions; bump LEXICON_VERSION when the format changes
+LEXICON_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'common_pw_strings')
+LEXICON_VERSION = 2
+
+def get_word_list():
+    """The nltk words corpus as a set, loaded on first use. The corpus is only downloaded when
+    nltk cannot find it locally, so nothing touches the network once it is installed."""
+    global _word_list
+    if _word_list is None:
+        import nltk
+        try:
+            nltk.data.find('corpora/words')
+        except LookupError:
+            if not nltk.download('words', quiet=True):
+                raise RuntimeError("the nltk words corpus is not installed and could not be downloaded")
+        from nltk.corpus import words
+        _word_list = set(words.words())
+    return _word_list
+
+def get_nlp():
+    """The spaCy model, loaded on first use."""
+    global _nlp
+    if _nlp is None:
+        import spacy
+        _nlp = spacy.load('en_core_web_sm')
+    return _nlp
+
+def __getattr__(name):
+    if name == 'word_list':
+        return get_word_list()
+    if name == 'nlp':
+        return get_nlp()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+class WordMatcher:
+    """Aho-Corasick automaton over a set of words: finds every word occurring in a string in one pass.
+
+    The trie is kept flat so it stays small with a few hundred thousand words: goto maps
+    (state << 21 | code point) to the next state, fail holds each state's failure link and
+    outputs the words ending at each state, including those reached through failure links.
+    States are numbered in the order goto gains them, so save() only writes goto's keys.
+    """
+
+    def __init__(self, patterns):
+        goto = {}
+        outputs = [()]
+        children = [[]]
+        for pattern in patterns:
+            if not pattern:
+                continue
+            state = 0
+            for char in pattern:
+                key = state << 21 | ord(char)
+                nxt = goto.get(key)
+                if nxt is None:
+                    nxt = goto[key] = len(outputs)
+                    outputs.append(())
+                    children.append([])
+                    children[state].append((ord(char), nxt))
+                state = nxt
+            outputs[state] = (pattern,)
+
+        # Breadth-first, so a state's failure link is always finished before its children's
+        fail = [0] * len(outputs)
+        queue = deque(child for _, child in children[0])
+        while queue:
+            state = queue.popleft()
+            for code, child in children[state]:
+                link = fail[state]
+                while link and (link << 21 | code) not in goto:
+                    link = fail[link]
+                link = goto.get(link << 21 | code, 0)
+                fail[child] = link
+                if outputs[link]:
+                    outputs[child] = outputs[child] + outputs[link]
+                queue.append(child)
+        self.goto = goto
+        self.fail = fail
+        self.outputs = outputs
+
+    def save(self, path):
+        """Writes the automaton with marshal (to a temporary file first, so readers never see half a file).
+        goto's keys and the failure links go in as flat arrays of 8 and 4 bytes per state."""
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        temporary = f"{path}.{os.getpid()}.tmp"
+        with open(temporary, 'wb') as file:
+            marshal.dump((LEXICON_VERSION, array('q', self.goto).tobytes(), array('i', self.fail).tobytes(),
+                          self.outputs), file)
+        os.replace(temporary, path)
+
+    @classmethod
+    def load(cls, path):
+        """Reads an automaton written by save(); raises ValueError if it is from another version."""
+        with open(path, 'rb') as file:
+            # marshal.load on the file object reads in small pieces and is several times slower
+            version, keys, fail, outputs = marshal.loads(file.read())
+        if version != LEXICON_VERSION:
+            raise ValueError(f"{path} holds a lexicon of another version")
+        matcher = cls.__new__(cls)
+        # State i + 1 is the one reached through the i-th key
+        matcher.goto = dict(zip(memoryview(keys).cast('q'), range(1, len(keys) // 8 + 1)))
+        matcher.fail = array('i')
+        matcher.fail.frombytes(fail)
+        matcher.outputs = outputs
+        return matcher
+
+    def find(self, text):
+        """Returns the set of patterns occurring anywhere in text."""
+        goto = self.goto
+        fail = self.fail
+        outputs = self.outputs
+        found = set()
+        state = 0
+        for char in text:
+            code = ord(char)
+            nxt = goto.get(state << 21 | code)
+            while nxt is None and state:
+                state = fail[state]
+                nxt = goto.get(state << 21 | code)
+            state = nxt or 0
+            if outputs[state]:
+                found.update(outputs[state])
+        return found
+
+# One matcher per min_length, built (or loaded from the lexicon cache) on first use
+_matchers = {}
+
+def nltk_data_dirs():
+    """The directories nltk.data.path searches by default: $NLTK_DATA, ~/nltk_data, then the
+    system-wide ones. Worked out here so the lexicon cache can be found without importing nltk."""
+    dirs = [path for path in os.environ.get('NLTK_DATA', '').split(os.pathsep) if path]
+    if os.path.expanduser('~/') != '~/':
+        dirs.append(os.path.expanduser('~/nltk_data'))
+    dirs += [os.path.join(sys.prefix, 'nltk_data'), os.path.join(sys.prefix, 'share', 'nltk_data'),
+             os.path.join(sys.prefix, 'lib', 'nltk_data')]
+    if sys.platform.startswith('win'):
+        dirs += [os.path.join(os.environ.get('APPDATA', 'C:\\'), 'nltk_data'),
+                 r'C:\nltk_data', r'D:\nltk_data', r'E:\nltk_data']
+    else:
+        dirs += ['/usr/share/nltk_data', '/usr/local/share/nltk_data', '/usr/lib/nltk_data', '/usr/local/lib/nltk_data']
+    return dirs
+
+def corpus_stamp():
+    """(size, mtime) of the installed nltk words corpus, or None when it is not installed. Looks
+    for it the way nltk.data.find does (an unpacked directory anywhere first, then the zip), but
+    only stats the files, so neither nltk nor the corpus is loaded."""
+    dirs = nltk_data_dirs()
+    candidates = [os.path.join(root, 'corpora', 'words') for root in dirs]
+    candidates += [os.path.join(root, 'corpora', 'words.zip') for root in dirs]
+    path = next((candidate for candidate in candidates if os.path.exists(candidate)), None)
+    if path is None:
+        return None
+    if os.path.isdir(path):
+        stats = [os.stat(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names]
+    else:
+        stats = [os.stat(path)]
+    return sum(stat.st_size for stat in stats), max((stat.st_mtime_ns for stat in stats), default=0)
+
+def lexicon_path(min_length=4):
+    """Default cache file for the compiled lexicon; the name changes with anything that changes its
+    content, including the size and modification time of the word corpus."""
+    key = repr((LEXICON_VERSION, min_length, sorted(specific_terms), sorted(exclusions), corpus_stamp()))
+    return os.path.join(LEXICON_DIR, f"lexicon-{hashlib.blake2b(key.encode(), digest_size=8).hexdigest()}.marshal")
+
+def get_matcher(min_length=4, path=None, rebuild=False):
+    """Returns the matcher for extract_words: every specific term, plus every dictionary word of at
+    least min_length characters that is neither excluded nor a specific term.
+
+    The automaton is cached at path (default: lexicon_path(min_length)), so later runs load it
+    without importing nltk or loading the corpus (about half a second for the full 236k-word
+    corpus, against several seconds to build it). The default path changes with the
+    corpus files, so a changed corpus is rebuilt; rebuild=True forces a rebuild, e.g. for an
+    explicit path.
+    """
+    matcher = _matchers.get(min_length)
+    if matcher is not None and not rebuild:
+        return matcher
+    default_path = path is None
+    path = path or lexicon_path(min_length)
+    if not rebuild:
+        try:
+            matcher = WordMatcher.load(path)
+        except (OSError, EOFError, ValueError, TypeError):
+            matcher = None
+    if matcher is None:
+        patterns = set(specific_terms)
+        patterns.update(word for word in get_word_list()
+                        if len(word) >= min_length and word not in exclusions and word not in specific_terms)
+        matcher = WordMatcher(patterns)
+        if default_path:
+            # The corpus may only just have been downloaded, which changes the default name
+            path = lexicon_path(min_length)
+        try:
+            matcher.save(path)
+        except OSError as e:
+            print(f"Warning: could not cache the lexicon at {path}: {e}")
+    _matchers[min_length] = matcher
+    return matcher
+
 def extract_words(s, min_length=4):
     """Extract valid words from the given string."""
+    return get_matcher(min_length).find(s.lower())
+
+def extract_words_naive(s, min_length=4):
+    """Original substring-probing version of extract_words, kept as a reference for benchmarks."""
     found_words = set()
     
     # Add specific terms directly
@@ -50,6 +321,7 @@ def extract_words(s, min_length=4):
     
     # Extract substrings of length >= min_length
     s_lower = s.lower()
+    word_list = get_word_list()
     for length in range(min_length, len(s_lower) + 1):
         for start in range(len(s_lower) - length + 1):
             substring = s_lower[start:start + length]
@@ -60,56 +332,401 @@ def extract_words(s, min_length=4):
 
 def extract_named_entities(s):
     """Extract named entities from the string using SpaCy."""
-    doc = nlp(s)
-    named_entities = set(ent.text.lower() for ent in doc.ents if ent.label_ in {'PERSON', 'ORG', 'GPE', 'LOC'})
+    doc = get_nlp()(s)
+    named_entities = set(ent.text.lower() for ent in doc.ents if ent.label_ in NER_LABELS)
     return named_entities
 
-def process_csv(file_path):
-    """Processes a CSV file and extracts valid words and full strings from every row."""
-    substring_counts = {}
-    full_string_counts = {}
-    
-    try:
-        with open(file_path, 'r', newline='', encoding='utf-8', errors='ignore') as csvfile:
-            reader = csv.reader(csvfile)
-            total_rows = sum(1 for _ in csvfile)  # Count rows for progress bar
-            
-            with open(file_path, 'r', newline='', encoding='utf-8', errors='ignore') as csvfile:
-                reader = csv.reader(csvfile)
-                for row in tqdm(reader, desc="Processing", total=total_rows, unit="row"):
-                    if row:
-                        cell_value = row[0]
-                        valid_words = extract_words(cell_value)
-                        named_entities = extract_named_entities(cell_value)
-                        valid_words.update(named_entities)
-                        
-                        # Count substrings
-                        for word in valid_words:
-                            if word in substring_counts:
-                                substring_counts[word] += 1
-                            else:
-                                substring_counts[word] = 1
-                        
-                        # Count full strings
-                        full_string_lower = cell_value.lower()
-                        if full_string_lower in full_string_counts:
-                            full_string_counts[full_string_lower] += 1
-                        else:
-                            full_string_counts[full_string_lower] = 1
+def iter_named_entities(values, mode='all', n_process=1, batch_size=NER_BATCH_SIZE):
+    """Yields (value, named entities) for every value, in order.
 
-    except FileNotFoundError:
-        print(f"Error: The file {file_path} does not exist.")
-        return
-    except PermissionError:
-        print(f"Error: Permission denied for the file {file_path}.")
+    Values are streamed through nlp.pipe in batches with every pipeline component except the
+    NER (and its tok2vec) disabled, on n_process processes. mode 'prefilter' only sends values
+    with a capitalized word (NER_PREFILTER) to spaCy, 'off' skips NER altogether.
+    """
+    if mode == 'off':
+        for value in values:
+            yield value, set()
         return
-    except csv.Error as e:
-        print(f"Error: CSV file reading error: {e}")
-        return
-    except Exception as e:
-        print(f"An unexpected error occurred: {e}")
+
+    # Values read but not yet matched with their doc, and whether they went to spaCy
+    pending = deque()
+
+    def feed():
+        for value in values:
+            wanted = mode == 'all' or NER_PREFILTER.search(value) is not None
+            pending.append((value, wanted))
+            if wanted:
+                yield value
+
+    nlp = get_nlp()
+    unused = [name for name in nlp.pipe_names if name not in NER_COMPONENTS]
+    with nlp.select_pipes(disable=unused):
+        for doc in nlp.pipe(feed(), batch_size=batch_size, n_process=n_process):
+            value, wanted = pending.popleft()
+            while not wanted:
+                yield value, set()
+                value, wanted = pending.popleft()
+            yield value, set(ent.text.lower() for ent in doc.ents if ent.label_ in NER_LABELS)
+    while pending:
+        yield pending.popleft()[0], set()
+
+class TopKSketch:
+    """Bounded-memory stand-in for a Counter: a Count-Min sketch plus the heavy hitters.
+
+    Every key is counted in depth rows of width counters (conservative update, so a count is
+    only ever over-estimated by keys sharing all of its counters); the tracked most frequent keys
+    are kept with their estimates. Memory is fixed by width, depth and tracked, whatever the
+    number of distinct keys. Hashing is blake2b, so sketches built in different processes or on
+    different hosts with the same width and depth can be combined with merge().
+    """
+
+    def __init__(self, width, depth=SKETCH_DEPTH, tracked=SKETCH_TRACKED):
+        self.width = width
+        self.depth = depth
+        self.tracked = tracked
+        self.rows = [array('q', bytes(8 * width)) for _ in range(depth)]
+        self.heavy = {}
+        self.heap = []
+
+    @classmethod
+    def with_memory(cls, megabytes, depth=SKETCH_DEPTH, tracked=SKETCH_TRACKED):
+        """Sketch whose counters take about megabytes MiB."""
+        return cls(max(1, (megabytes << 20) // (8 * depth)), depth, tracked)
+
+    def cells(self, key):
+        digest = hashlib.blake2b(key.encode('utf-8', 'surrogatepass'), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return [(h1 + i * h2) % self.width for i in range(self.depth)]
+
+    def estimate(self, key):
+        return min(row[cell] for row, cell in zip(self.rows, self.cells(key)))
+
+    def add(self, key, count=1):
+        cells = self.cells(key)
+        rows = self.rows
+        current = min(row[cell] for row, cell in zip(rows, cells))
+        estimate = current + count
+        for row, cell in zip(rows, cells):
+            if row[cell] < estimate:
+                row[cell] = estimate
+        self.track(key, estimate)
+
+    def track(self, key, estimate):
+        heavy = self.heavy
+        if key in heavy:
+            heavy[key] = estimate
+        elif len(heavy) < self.tracked:
+            heavy[key] = estimate
+        else:
+            # The heap holds stale entries for keys whose estimate grew; skip past them
+            heap = self.heap
+            while heap[0][0] != heavy.get(heap[0][1]):
+                heapq.heappop(heap)
+            if estimate <= heap[0][0]:
+                return
+            del heavy[heapq.heappop(heap)[1]]
+            heavy[key] = estimate
+        heapq.heappush(self.heap, (estimate, key))
+        if len(self.heap) > 4 * self.tracked:
+            self.heap = [(count, key) for key, count in heavy.items()]
+            heapq.heapify(self.heap)
+
+    def update(self, keys):
+        """Counts each key once, like Counter.update."""
+        for key in keys:
+            self.add(key)
+
+    def items(self):
+        """The heavy hitters and their estimated counts."""
+        return self.heavy.items()
+
+    def merge(self, other):
+        """Adds the counts of another sketch of the same shape into this one."""
+        if (other.width, other.depth) != (self.width, self.depth):
+            raise ValueError("sketches must have the same width and depth to be merged")
+        for row, other_row in zip(self.rows, other.rows):
+            for cell, count in enumerate(other_row):
+                if count:
+                    row[cell] += count
+        return self.refresh(set(self.heavy) | set(other.heavy))
+
+    def refresh(self, keys=None):
+        """Re-estimates the tracked keys (or the given ones, keeping the top tracked) from the
+        current counters, since a key's estimate can have grown after it was last counted."""
+        keys = self.heavy if keys is None else keys
+        estimates = sorted(((self.estimate(key), key) for key in keys), reverse=True)[:self.tracked]
+        self.heavy = {key: count for count, key in estimates}
+        self.heap = [(count, key) for key, count in self.heavy.items()]
+        heapq.heapify(self.heap)
+        return self
+
+def iter_lines(file, progress=None):
+    """Decodes the lines of a file opened in binary mode the way open(..., newline='') would,
+    counting lines and moving the progress bar by bytes read."""
+    stats = {'lines': 0}
+
+    def lines():
+        pending = 0
+        for line in file:
+            pending += len(line)
+            if progress is not None and pending >= PROGRESS_BYTES:
+                progress.update(pending)
+                pending = 0
+            text = line.decode('utf-8', 'ignore')
+            if '\r' in text.rstrip('\r\n'):
+                # A bare \r also ends a line in text mode
+                for part in io.StringIO(text, newline=''):
+                    stats['lines'] += 1
+                    yield part
+            else:
+                stats['lines'] += 1
+                yield text
+        if progress is not None:
+            progress.update(pending)
+
+    return lines(), stats
+
+def timed(iterable, timings, stage):
+    """Passes the items of iterable through, adding the time spent producing them to timings[stage]."""
+    iterator = iter(iterable)
+    while True:
+        started = time.perf_counter()
+        try:
+            item = next(iterator)
+        except StopIteration:
+            timings[stage] += time.perf_counter() - started
+            return
+        timings[stage] += time.perf_counter() - started
+        yield item
+
+def read_range(file, start, end):
+    """Yields the lines of a binary file that start at byte offsets in [start, end)."""
+    file.seek(start)
+    position = start
+    while position < end:
+        line = file.readline()
+        if not line:
+            return
+        position += len(line)
+        yield line
+
+def shard_ranges(file_path, shards, start=0, end=None):
+    """Splits the bytes [start, end) of a file into up to shards ranges that begin at line starts."""
+    if end is None:
+        end = os.path.getsize(file_path)
+    bounds = [start]
+    with open(file_path, 'rb') as file:
+        for i in range(1, shards):
+            file.seek(max(start, start + (end - start) * i // shards - 1))
+            file.readline()
+            bounds.append(min(max(file.tell(), bounds[-1]), end))
+    bounds.append(end)
+    return [(low, high) for low, high in zip(bounds, bounds[1:]) if high > low]
+
+def new_counters(counts='exact', sketch_memory=SKETCH_MEMORY, structure=False):
+    """The (substring, full string) counters for a counts mode, plus the mask counter with structure.
+    Sketches share sketch_memory MiB equally, so there are halves without structure and thirds with it."""
+    parts = 3 if structure else 2
+    if counts == 'sketch':
+        return tuple(TopKSketch.with_memory(max(1, sketch_memory // parts)) for _ in range(parts))
+    return tuple(Counter() for _ in range(parts))
+
+def merge_counters(total, other):
+    """Adds the counts of other into total (Counters or TopKSketches) and returns total.
+    Counters keep first-seen order, so merging shards in file order matches a serial run."""
+    if isinstance(total, TopKSketch):
+        return total.merge(other)
+    total.update(other)
+    return total
+
+class MaskTable(dict):
+    """str.translate table mapping characters to hashcat mask classes; characters outside
+    MASK_CLASSES become one 'b' per UTF-8 byte, since ?b matches a single byte."""
+
+    def __missing__(self, code):
+        self[code] = 'b' * len(chr(code).encode('utf-8', 'surrogatepass'))
+        return self[code]
+
+MASK_TABLE = MaskTable(str.maketrans(MASK_CLASSES))
+
+# bytes.translate table doing the same to UTF-8 bytes, except that '\n' is kept to split a batch on:
+# every byte of a non-ASCII character is 'b', as are ASCII characters outside MASK_CLASSES
+MASK_BYTES = bytes(ord(MASK_CLASSES.get(chr(code), 'b')) if code != ord('\n') else code for code in range(256))
+
+# Trailing digits and trailing years of every row of a '\n'-joined batch
+TRAILING_DIGITS = re.compile(r'[0-9]+$', re.MULTILINE)
+TRAILING_YEAR = re.compile(r'(?:19|20)[0-9][0-9]$', re.MULTILINE)
+
+def to_hashcat_mask(compact):
+    """'ulldd' -> '?u?l?l?d?d'"""
+    return ''.join('?' + char for char in compact)
+
+# Character-set composition label of each set of mask classes, filled in as they are seen
+_charset_labels = {}
+
+def charset_label(classes):
+    """'lower+digit' for {'l', 'd'}"""
+    label = _charset_labels.get(classes)
+    if label is None:
+        label = _charset_labels[classes] = '+'.join(name for char, name in CHARSET_NAMES if char in classes) or 'empty'
+    return label
+
+class StructureStats:
+    """Structure of every password seen: its mask (kept compact, 'ulldd' for ?u?l?l?d?d), length,
+    trailing digits, trailing year and character-set composition. Rows are taken a batch at a
+    time and joined with '\n', so the masks come from one bytes.translate of the whole batch and
+    the suffixes from one regex scan; only the distinct masks of a batch are looked at one by one.
+    masks can be a TopKSketch for --counts sketch; the other counters stay small anyway.
+    """
+
+    KINDS = ('mask', 'length', 'digits', 'year', 'charset')
+
+    def __init__(self, masks=None):
+        self.counters = {'mask': Counter() if masks is None else masks, 'length': Counter(),
+                         'digits': Counter(), 'year': Counter(), 'charset': Counter()}
+
+    def update(self, values):
+        """Counts the structure of a batch (list) of passwords."""
+        counters = self.counters
+        joined = '\n'.join(values)
+        if joined.count('\n') == len(values) - 1:
+            masks = Counter(joined.encode('utf-8', 'surrogatepass').translate(MASK_BYTES).decode('ascii').split('\n'))
+            suffixes = TRAILING_DIGITS.findall(joined)
+        else:
+            # Some row holds a newline itself, so the batch cannot be split on them
+            masks = Counter(map(str.translate, values, repeat(MASK_TABLE)))
+            suffixes = [value[len(value.rstrip(string.digits)):] for value in values]
+            suffixes = [suffix for suffix in suffixes if suffix]
+        counters['digits'].update(suffixes)
+        counters['year'].update(TRAILING_YEAR.findall('\n'.join(suffixes)))
+        lengths = counters['length']
+        if joined.isascii():
+            # One mask character per character, so the lengths follow from the distinct masks
+            for compact, count in masks.items():
+                lengths[len(compact)] += count
+        else:
+            lengths.update(map(len, values))
+        if isinstance(counters['mask'], TopKSketch):
+            for compact, count in masks.items():
+                counters['mask'].add(compact, count)
+        else:
+            counters['mask'].update(masks)
+        charsets = counters['charset']
+        for compact, count in masks.items():
+            charsets[charset_label(frozenset(compact))] += count
+
+    def merge(self, other):
+        for kind in self.KINDS:
+            merge_counters(self.counters[kind], other.counters[kind])
+        return self
+
+    def top(self, kind, limit=STRUCTURE_ROWS):
+        return sorted(self.counters[kind].items(), key=lambda item: item[1], reverse=True)[:limit]
+
+    def total(self):
+        return sum(self.counters['length'].values())
+
+def write_masks(structure, path=MASK_FILE, limit=MASK_TOP):
+    """Writes the most common masks, most common first, as a hashcat .hcmask file (hashcat -a 3 <file>)."""
+    with open(path, 'w', encoding='utf-8') as file:
+        file.writelines(f"{to_hashcat_mask(compact)}\n" for compact, _ in structure.top('mask', limit))
+
+def print_structure(structure):
+    """Prints the structure tables of a StructureStats or a CountStore."""
+    total = structure.total()
+    if not total:
         return
-    
+    share = lambda count: f"{count / total:.1%}"
+    print(f"\nTop {STRUCTURE_ROWS} Masks (top {MASK_TOP} written to {MASK_FILE}):")
+    print(tabulate([(to_hashcat_mask(compact), count, share(count))
+                    for compact, count in structure.top('mask', STRUCTURE_ROWS)],
+                   headers=["Mask", "Occurrences", "Share"], tablefmt="grid"))
+    print("\nLength Histogram:")
+    lengths = sorted(structure.top('length', None), key=lambda item: int(item[0]))
+    print(tabulate([(length, count, share(count)) for length, count in lengths],
+                   headers=["Length", "Occurrences", "Share"], tablefmt="grid"))
+    for kind, title, header in (('digits', "Trailing Digits", "Digits"), ('year', "Trailing Years", "Year"),
+                                ('charset', "Character-Set Composition", "Classes")):
+        print(f"\nTop {STRUCTURE_ROWS} {title}:")
+        print(tabulate([(key, count, share(count)) for key, count in structure.top(kind, STRUCTURE_ROWS)],
+                       headers=[header, "Occurrences", "Share"], tablefmt="grid"))
+
+def count_range(file_path, start, end, ner='all', n_process=1, batch_size=NER_BATCH_SIZE,
+                counts='exact', sketch_memory=SKETCH_MEMORY, progress=None, structure=False):
+    """Counts the words and full strings of the rows in bytes [start, end) of a CSV file.
+
+    Returns (substring counts, full string counts, lines read, stage timings, StructureStats or
+    None). Runs in worker processes for process_csv(workers > 1), so everything it returns can
+    be pickled.
+    """
+    counters = new_counters(counts, sketch_memory, structure)
+    substring_counts, full_string_counts = counters[:2]
+    timings = dict.fromkeys(STAGES, 0.0)
+    stats = StructureStats(counters[2]) if structure else None
+    batch = []
+    with open(file_path, 'rb') as binary_file:
+        lines, line_stats = iter_lines(read_range(binary_file, start, end), progress)
+        reader = csv.reader(lines)
+        values = timed((row[0] for row in reader if row), timings, 'read')
+        entity_stream = timed(iter_named_entities(values, ner, n_process, batch_size), timings, 'ner')
+        for cell_value, named_entities in entity_stream:
+            started = time.perf_counter()
+            valid_words = extract_words(cell_value)
+            valid_words.update(named_entities)
+            counting = time.perf_counter()
+            timings['words'] += counting - started
+
+            # Count substrings (sorted, so ties come out the same in every run) and the full string
+            substring_counts.update(sorted(valid_words))
+            full_string_counts.update((cell_value.lower(),))
+            timings['count'] += time.perf_counter() - counting
+            if stats is not None:
+                batch.append(cell_value)
+                if len(batch) >= STRUCTURE_BATCH:
+                    structuring = time.perf_counter()
+                    stats.update(batch)
+                    batch = []
+                    timings['structure'] += time.perf_counter() - structuring
+
+    if batch:
+        structuring = time.perf_counter()
+        stats.update(batch)
+        timings['structure'] += time.perf_counter() - structuring
+
+    # Reading happens inside the NER stream, so take it out of the NER time
+    timings['ner'] -= timings['read']
+    return substring_counts, full_string_counts, line_stats['lines'], timings, stats
+
+def save_counts(path, substring_counts, full_string_counts, total_rows, structure=None):
+    """Writes counters to a file that merge_count_files can combine with others, e.g. from other hosts."""
+    with open(path, 'wb') as file:
+        pickle.dump({'version': COUNTS_VERSION, 'substrings': substring_counts, 'full_strings': full_string_counts,
+                     'lines': total_rows, 'structure': structure}, file, pickle.HIGHEST_PROTOCOL)
+
+def merge_count_files(paths):
+    """Loads and merges files written by save_counts, in the given order.
+    Returns (substring counts, full string counts, total rows, StructureStats or None); the
+    structure statistics are only merged from the files that have them."""
+    substring_counts = full_string_counts = structure = None
+    total_rows = 0
+    for path in paths:
+        with open(path, 'rb') as file:
+            saved = pickle.load(file)
+        if saved.get('version') != COUNTS_VERSION:
+            raise ValueError(f"{path} was not written by this version of common_pw_strings")
+        if substring_counts is None:
+            substring_counts, full_string_counts = saved['substrings'], saved['full_strings']
+        else:
+            merge_counters(substring_counts, saved['substrings'])
+            merge_counters(full_string_counts, saved['full_strings'])
+        if saved.get('structure') is not None:
+            structure = saved['structure'] if structure is None else structure.merge(saved['structure'])
+        total_rows += saved['lines']
+    return substring_counts, full_string_counts, total_rows, structure
+
+def top_entries(substring_counts, full_string_counts):
+    """The top 50 substrings seen more than 10 times and the top 50 full strings, with their counts."""
     # Filter and sort substrings that appear more than 10 times
     filtered_substrings = {word: count for word, count in substring_counts.items() if count > 10}
     
@@ -118,7 +735,10 @@ def process_csv(file_path):
     
     # Sort full strings by frequency in descending order and get the top 50
     top_50_full_strings = sorted(full_string_counts.items(), key=lambda item: item[1], reverse=True)[:50]
-    
+    return top_50_substrings, top_50_full_strings
+
+def write_top_entries(top_50_substrings, top_50_full_strings):
+    """Writes frequent_words.txt and frequent_passwords.txt."""
     # Write the top 50 substrings to a file
     with open('frequent_words.txt', 'w', encoding='utf-8') as file:
         file.writelines(f"{word}\n" for word, _ in top_50_substrings)
@@ -126,18 +746,308 @@ def process_csv(file_path):
     # Write the top 50 full strings to a file
     with open('frequent_passwords.txt', 'w', encoding='utf-8') as file:
         file.writelines(f"{string}\n" for string, _ in top_50_full_strings)
+
+class StoreError(Exception):
+    """Raised when a file cannot be added to a CountStore without counting rows twice."""
+
+def file_fingerprint(file_path, size=None):
+    """Identifies a file by its size and its first and last FINGERPRINT_BYTES, so an already
+    ingested dump is recognised even if it was renamed or moved, without reading all of it.
+    With size, only the first size bytes count, which checks that a grown file still starts
+    with what was ingested before."""
+    if size is None:
+        size = os.path.getsize(file_path)
+    digest = hashlib.blake2b(str(size).encode(), digest_size=16)
+    with open(file_path, 'rb') as file:
+        digest.update(file.read(FINGERPRINT_BYTES))
+        if size > FINGERPRINT_BYTES:
+            file.seek(max(FINGERPRINT_BYTES, size - FINGERPRINT_BYTES))
+            digest.update(file.read(size - file.tell()))
+    return digest.hexdigest()
+
+class CountStore:
+    """Persistent SQLite store of substring and full-string counts, added to one dump at a time.
+
+    counts holds one row per (kind, key); new keys get increasing rowids, so ordering by
+    (count DESC, rowid) breaks ties by first appearance, like the Counters of a single run, and
+    the (kind, count DESC) index answers top-K queries without scanning the table. files records
+    every ingest by file_fingerprint, path and size, so a dump is never counted twice and a dump
+    that has grown since is only counted from where the last ingest stopped.
+    """
+
+    def __init__(self, path=DEFAULT_STORE):
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("""CREATE TABLE IF NOT EXISTS counts (
+                                 kind TEXT NOT NULL,
+                                 key TEXT NOT NULL,
+                                 count INTEGER NOT NULL,
+                                 UNIQUE (kind, key))""")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS counts_top ON counts (kind, count DESC)")
+        self.conn.execute("""CREATE TABLE IF NOT EXISTS files (
+                                 fingerprint TEXT PRIMARY KEY,
+                                 path TEXT NOT NULL,
+                                 size INTEGER NOT NULL,
+                                 lines INTEGER NOT NULL,
+                                 ingested_at REAL NOT NULL)""")
+        self.conn.commit()
+
+    def has_file(self, fingerprint):
+        return self.conn.execute("SELECT 1 FROM files WHERE fingerprint = ?", (fingerprint,)).fetchone() is not None
+
+    def last_ingest(self, file_path):
+        """(size, fingerprint) of the largest earlier ingest of this path, or None."""
+        return self.conn.execute("SELECT size, fingerprint FROM files WHERE path = ? ORDER BY size DESC LIMIT 1",
+                                 (os.path.abspath(file_path),)).fetchone()
+
+    def add(self, fingerprint, file_path, size, substring_counts, full_string_counts, lines, structure=None):
+        """Folds the counts of one dump (and its StructureStats, if any) into the store, in a single transaction.
+        size is the number of bytes that were counted, which may be less than the file holds by now."""
+        upsert = """INSERT INTO counts (kind, key, count) VALUES (?, ?, ?)
+                    ON CONFLICT (kind, key) DO UPDATE SET count = count + excluded.count"""
+        with self.conn:
+            self.conn.executemany(upsert, (('word', key, count) for key, count in substring_counts.items()))
+            self.conn.executemany(upsert, (('full', key, count) for key, count in full_string_counts.items()))
+            if structure is not None:
+                for kind in StructureStats.KINDS:
+                    self.conn.executemany(upsert, ((kind, str(key), count)
+                                                   for key, count in structure.counters[kind].items()))
+            self.conn.execute("INSERT INTO files VALUES (?, ?, ?, ?, ?)",
+                              (fingerprint, os.path.abspath(file_path), size, lines, time.time()))
+
+    def top(self, kind, limit=50, above=0):
+        """The limit (None = all) most frequent keys of a kind counted more than above times, with their counts."""
+        return self.conn.execute("""SELECT key, count FROM counts WHERE kind = ? AND count > ?
+                                    ORDER BY count DESC, rowid LIMIT ?""",
+                                 (kind, above, -1 if limit is None else limit)).fetchall()
+
+    def total(self):
+        """Number of passwords with stored structure statistics (the length histogram's total)."""
+        return self.conn.execute("SELECT COALESCE(SUM(count), 0) FROM counts WHERE kind = 'length'").fetchone()[0]
+
+    def top_entries(self):
+        """Same as top_entries() on the stored counts."""
+        return self.top('word', 50, 10), self.top('full', 50)
+
+    def lines(self):
+        return self.conn.execute("SELECT COALESCE(SUM(lines), 0) FROM files").fetchone()[0]
+
+    def close(self):
+        self.conn.close()
+
+def process_csv(file_path, ner='all', n_process=1, batch_size=NER_BATCH_SIZE, timings=None,
+                counts='exact', sketch_memory=SKETCH_MEMORY, workers=1, shard=None, save_path=None, store=None,
+                structure=None):
+    """Processes a CSV file and extracts valid words and full strings from every row.
+
+    The file is read once, with progress shown in bytes. ner, n_process and batch_size are passed
+    to iter_named_entities. counts='sketch' counts with TopKSketches sharing sketch_memory MiB
+    (see new_counters) instead of exact Counters, so memory stays fixed however many distinct passwords there
+    are. If timings is a dict, the seconds spent reading, extracting words, running NER and
+    counting are added to it (summed over workers).
+
+    workers > 1 splits the file into byte ranges at line boundaries, counts them on a process
+    pool and merges the counters in file order, so the output matches a serial run (rows must
+    not span lines). shard=(i, n) only counts the i-th of n byte ranges, and save_path writes
+    the counters with save_counts, so shards can be counted on different hosts and combined
+    with merge_count_files.
+
+    With a CountStore, the file's counts are folded into the store (unless it was ingested
+    before) and the outputs come from all the stored counts, not just this file's. A file that
+    was appended to since its last ingest only has the appended rows counted; one that was
+    otherwise rewritten is refused, since its old rows would be counted again.
+
+    If structure is a dict, StructureStats are also collected in the same pass, the top masks
+    are written to MASK_FILE and structure['stats'] is set to the StructureStats (or to the
+    CountStore when one is used). Returns (top substrings, top full strings, rows).
+    """
+    if timings is None:
+        timings = {}
+    for stage in STAGES:
+        timings.setdefault(stage, 0.0)
+    
+    try:
+        start, end = 0, os.path.getsize(file_path)
+        if shard is not None:
+            index, shard_count = shard
+            ranges = shard_ranges(file_path, shard_count)
+            start, end = ranges[index - 1] if index <= len(ranges) else (end, end)
+
+        fingerprint = None
+        if store is not None:
+            fingerprint = file_fingerprint(file_path, end)
+            if store.has_file(fingerprint):
+                print(f"{file_path} has already been ingested; using the stored counts.")
+                top_50_substrings, top_50_full_strings = store.top_entries()
+                write_top_entries(top_50_substrings, top_50_full_strings)
+                if structure is not None:
+                    write_masks(store)
+                    structure['stats'] = store
+                return top_50_substrings, top_50_full_strings, store.lines()
+            last = store.last_ingest(file_path)
+            if last is not None:
+                # The dump has grown: only the bytes after the last ingest are new, provided the
+                # old part is unchanged and ended on a complete line
+                ingested, ingested_fingerprint = last
+                if ingested >= end or file_fingerprint(file_path, ingested) != ingested_fingerprint:
+                    raise StoreError(f"{file_path} has changed since it was ingested, but not by growing; "
+                                     f"its rows would be counted twice. Use a new store for the rewritten file.")
+                with open(file_path, 'rb') as file:
+                    file.seek(ingested - 1)
+                    if file.read(1) != b'\n':
+                        raise StoreError(f"{file_path} was ingested without a final newline, so the appended "
+                                         f"bytes continue its last row; it cannot be ingested incrementally.")
+                print(f"{file_path} has grown since it was ingested; counting the {end - ingested:,} new bytes.")
+                start = ingested
+
+        # Loaded before the workers start, so forked workers inherit them instead of loading their own
+        get_matcher()
+        if ner != 'off':
+            get_nlp()
+
+        with tqdm(desc="Processing", total=end - start, unit="B", unit_scale=True, unit_divisor=1024) as progress:
+            if workers > 1:
+                ranges = shard_ranges(file_path, workers, start, end)
+                with ProcessPoolExecutor(max_workers=workers) as pool:
+                    futures = {pool.submit(count_range, file_path, low, high, ner, 1, batch_size, counts, sketch_memory,
+                                           None, structure is not None): high - low for low, high in ranges}
+                    for future in as_completed(futures):
+                        progress.update(futures[future])
+                    results = [future.result() for future in futures]
+            else:
+                results = [count_range(file_path, start, end, ner, n_process, batch_size, counts, sketch_memory,
+                                       progress, structure is not None)]
+
+        # The first range's counters are merged into rather than fresh ones, so the counts (and
+        # sketches) are only held once more than the ranges themselves, not twice
+        if results:
+            substring_counts, full_string_counts = results[0][:2]
+        else:
+            substring_counts, full_string_counts = new_counters(counts, sketch_memory, structure is not None)[:2]
+        stats = None
+        total_rows = 0
+        for index, (shard_substrings, shard_full_strings, lines, shard_timings, shard_stats) in enumerate(results):
+            if index:
+                merge_counters(substring_counts, shard_substrings)
+                merge_counters(full_string_counts, shard_full_strings)
+            if shard_stats is not None:
+                stats = shard_stats if stats is None else stats.merge(shard_stats)
+            total_rows += lines
+            for stage in STAGES:
+                timings[stage] += shard_timings[stage]
+        if isinstance(substring_counts, TopKSketch):
+            substring_counts.refresh()
+            full_string_counts.refresh()
+
+        if save_path:
+            save_counts(save_path, substring_counts, full_string_counts, total_rows, stats)
+        if store is not None:
+            store.add(fingerprint, file_path, end, substring_counts, full_string_counts, total_rows, stats)
+            top_50_substrings, top_50_full_strings = store.top_entries()
+            total_rows = store.lines()
+            if stats is not None:
+                stats = store
+        else:
+            top_50_substrings, top_50_full_strings = top_entries(substring_counts, full_string_counts)
+
+    except FileNotFoundError:
+        print(f"Error: The file {file_path} does not exist.")
+        return
+    except PermissionError:
+        print(f"Error: Permission denied for the file {file_path}.")
+        return
+    except csv.Error as e:
+        print(f"Error: CSV file reading error: {e}")
+        return
+    except StoreError as e:
+        print(f"Error: {e}")
+        return
+    except Exception as e:
+        print(f"An unexpected error occurred: {e}")
+        return
     
+    write_top_entries(top_50_substrings, top_50_full_strings)
+    if stats is not None:
+        write_masks(stats)
+        structure['stats'] = stats
     return top_50_substrings, top_50_full_strings, total_rows
 
 def main():
     print("\n=== Common String Search ===\n")
     
     parser = argparse.ArgumentParser(description='Extract valid words and full strings from a CSV file.')
-    parser.add_argument('csv_file', type=str, help='Path to the CSV file to process')
+    parser.add_argument('csv_file', type=str, nargs='?', help='Path to the CSV file to process')
+    parser.add_argument('--ner', choices=['all', 'prefilter', 'off'], default='all',
+                        help='Run named entity recognition on every row, only on rows with a capitalized word, or not at all')
+    parser.add_argument('--ner-processes', type=int, default=1, help='Processes spaCy runs NER on')
+    parser.add_argument('--ner-batch-size', type=int, default=NER_BATCH_SIZE, help='Rows per spaCy batch')
+    parser.add_argument('--counts', choices=['exact', 'sketch'], default='exact',
+                        help='Count exactly, or with fixed-memory Count-Min sketches that track the top entries')
+    parser.add_argument('--sketch-memory', type=int, default=SKETCH_MEMORY,
+                        help='MiB used by the sketches with --counts sketch')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='Processes to count on, each taking a byte range of the file (0 = one per CPU core)')
+    parser.add_argument('--shard', help='Only count shard I of N of the file, given as I/N (use with --save-counts)')
+    parser.add_argument('--save-counts', help='Save the counts to this file for --merge-counts')
+    parser.add_argument('--merge-counts', nargs='+', metavar='FILE',
+                        help='Combine counts saved with --save-counts instead of reading a CSV file')
+    parser.add_argument('--store', nargs='?', const=DEFAULT_STORE,
+                        help=f'Add the counts to a persistent SQLite store (default: {DEFAULT_STORE}) and report '
+                             'the top entries of everything stored; without a CSV file, just report them')
+    parser.add_argument('--structure', action='store_true',
+                        help=f'Also collect password structure statistics (masks, lengths, suffixes, character sets) '
+                             f'and write the top {MASK_TOP} masks to {MASK_FILE}')
+    parser.add_argument('--lexicon', help=f'Compiled lexicon cache file (default: under {LEXICON_DIR})')
+    parser.add_argument('--rebuild-lexicon', action='store_true',
+                        help='Rebuild the compiled lexicon from the nltk word list')
     args = parser.parse_args()
 
-    top_substrings, top_full_strings, line_count = process_csv(args.csv_file)
-    
+    shard = None
+    if args.shard:
+        try:
+            shard = tuple(int(part) for part in args.shard.split('/'))
+            if len(shard) != 2 or not 1 <= shard[0] <= shard[1]:
+                raise ValueError
+        except ValueError:
+            parser.error("--shard must look like 2/8")
+    if not args.csv_file and not args.merge_counts and not args.store:
+        parser.error("a CSV file, --merge-counts or --store is needed")
+    if args.store and (args.merge_counts or shard or args.counts == 'sketch'):
+        parser.error("--store keeps exact counts of whole files; it cannot be used with --merge-counts, --shard or --counts sketch")
+
+    timings = {}
+    store = CountStore(args.store) if args.store else None
+    if args.merge_counts:
+        substring_counts, full_string_counts, line_count, structure = merge_count_files(args.merge_counts)
+        result = top_entries(substring_counts, full_string_counts) + (line_count,)
+        write_top_entries(*result[:2])
+        if structure is not None:
+            write_masks(structure)
+    elif store is not None and not args.csv_file:
+        result = store.top_entries() + (store.lines(),)
+        structure = store if args.structure else None
+        write_top_entries(*result[:2])
+        if structure is not None:
+            write_masks(structure)
+    else:
+        try:
+            get_matcher(path=args.lexicon, rebuild=args.rebuild_lexicon)
+        except (LookupError, RuntimeError) as e:
+            print(f"Error: could not load the word list: {e}")
+            return
+        collected = {} if args.structure else None
+        result = process_csv(args.csv_file, args.ner, args.ner_processes, args.ner_batch_size, timings,
+                             args.counts, args.sketch_memory, args.workers or os.cpu_count() or 1, shard,
+                             args.save_counts, store, collected)
+        structure = collected.get('stats') if collected is not None else None
+    try:
+        if result is not None:
+            print_results(*result, structure, timings)
+    finally:
+        if store is not None:
+            store.close()
+
+def print_results(top_substrings, top_full_strings, line_count, structure, timings):
+    """Prints the tables for main, with the structure tables when there are structure statistics."""
     if top_substrings:
         print("Top 50 Detected Substrings:")
         headers_substrings = ["String", "Occurrences"]
@@ -152,5 +1062,15 @@ def main():
     
     print(f"\n{line_count:,} lines processed.")
 
+    if structure is not None:
+        print_structure(structure)
+
+    total = sum(timings.values())
+    if not total:
+        return
+    print("\nTime per stage:")
+    print(tabulate([(stage, f"{timings[stage]:.2f}s", f"{timings[stage] / total:.0%}") for stage in STAGES],
+                   headers=["Stage", "Time", "Share"], tablefmt="grid"))
+
 if __name__ == "__main__":
     main()
@@ -0,0 +1,83 @@
+"""
+Benchmark for common_pw_strings.extract_words: the Aho-Corasick matcher against the original
+substring-probing version (extract_words_naive), on the same passwords.
+Requirements: The same modules as common_pw_strings.py (nltk words corpus, spaCy model).
+Input: An optional .csv of passwords (column 1); otherwise passwords are generated from the word list.
+Output: Matcher build time, seconds and rows/sec for both versions, the speedup, and the number
+        of rows where the two disagree (should always be 0).
+Example Usage (in terminal):
+---
+$python3 common_pw_strings_bench.py
+$python3 common_pw_strings_bench.py --csv crackable_pwds.csv --rows 200000
+---
+"""
+import csv
+import time
+import random
+import argparse
+import common_pw_strings
+
+
+#Builds n password-like strings: one to three dictionary or specific-term words, some uppercased,
+#followed by a number or year.
+def make_passwords(n, seed):
+    rng = random.Random(seed)
+    vocabulary = sorted(common_pw_strings.word_list) + sorted(common_pw_strings.specific_terms)
+    passwords = []
+    for _ in range(n):
+        parts = [rng.choice(vocabulary) for _ in range(rng.randint(1, 3))]
+        parts = [part.upper() if rng.random() < 0.1 else part for part in parts]
+        passwords.append(''.join(parts) + str(rng.randint(0, 2024)))
+    return passwords
+
+
+#Reads up to n first-column values from a .csv file.
+def read_passwords(path, n):
+    passwords = []
+    with open(path, 'r', newline='', encoding='utf-8', errors='ignore') as csvfile:
+        for row in csv.reader(csvfile):
+            if row:
+                passwords.append(row[0])
+                if len(passwords) >= n:
+                    break
+    return passwords
+
+
+#Runs extract on every password and returns (seconds, results).
+def run(extract, passwords, min_length):
+    started = time.perf_counter()
+    results = [extract(password, min_length) for password in passwords]
+    return time.perf_counter() - started, results
+
+
+def main():
+
+    #Parse the command-line arguments:
+    parser = argparse.ArgumentParser(description="extract_words benchmark: Aho-Corasick vs substring probing")
+    parser.add_argument('--csv', help="Password .csv to use (default: generated passwords)")
+    parser.add_argument('--rows', type=int, default=50000, help="Number of passwords to run")
+    parser.add_argument('--min-length', type=int, default=4, help="min_length passed to extract_words")
+    parser.add_argument('--seed', type=int, default=0, help="Seed for the generated passwords")
+    args = parser.parse_args()
+
+    passwords = read_passwords(args.csv, args.rows) if args.csv else make_passwords(args.rows, args.seed)
+
+    started = time.perf_counter()
+    common_pw_strings.get_matcher(args.min_length)
+    build_time = time.perf_counter() - started
+
+    naive_time, expected = run(common_pw_strings.extract_words_naive, passwords, args.min_length)
+    matcher_time, actual = run(common_pw_strings.extract_words, passwords, args.min_length)
+    mismatches = sum(1 for a, b in zip(expected, actual) if a != b)
+
+    print(f"{len(passwords):,} passwords, average length {sum(map(len, passwords)) / max(len(passwords), 1):.1f}")
+    print(f"Matcher built in {build_time:.2f}s\n")
+    print("{:>14} {:>10} {:>12}".format("version", "seconds", "rows/sec"))
+    print("-" * 38)
+    print("{:>14} {:>10.2f} {:>12,.0f}".format("naive", naive_time, len(passwords) / naive_time))
+    print("{:>14} {:>10.2f} {:>12,.0f}".format("aho-corasick", matcher_time, len(passwords) / matcher_time))
+    print(f"\nSpeedup: {naive_time / matcher_time:.2f}x, mismatching rows: {mismatches}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+"""
+Throughput benchmark for HashScan.py. Runs entirely offline against vt_stub_server.py.
+Requirements: The requests module (for HashScan.py).
+Output: A table with, for each concurrency level, hashes/sec, p50/p99 request latency,
+        API requests sent (including retries) and quota efficiency, which is the share
+        of request capacity (requests * batch size) that actually returned a verdict.
+        Every verdict is checked against the stub's, and mismatches are counted as wrong
+        (this should always be 0, also with --max-resources below --batch-size).
+Example Usage (in terminal):
+---
+$python3 hashscan_bench.py
+$python3 hashscan_bench.py --hashes 2000 --concurrency 1,4,16,32 --batch-size 4 --latency 50 --throttle-rate 0.05
+$python3 hashscan_bench.py --batch-size 4 --max-resources 2
+---
+"""
+import time
+import random
+import argparse
+import HashScan
+from vt_stub_server import start_stub_server, make_report
+
+
+#Returns the q-th percentile (0-100) of an already sorted list.
+def percentile(values, q):
+    if not values:
+        return 0.0
+    index = min(len(values) - 1, int(round(q / 100 * (len(values) - 1))))
+    return values[index]
+
+
+#Scans the hashes once at the given concurrency and returns the measurements.
+def run_once(hashes, url, workers, batch_size, rate, retries, backoff):
+    metrics = HashScan.ScanMetrics()
+    verdicts = failures = wrong = 0
+    started = time.perf_counter()
+    for file_hash, report in HashScan.scan_hashes(hashes, workers=workers, rate=rate, api_url=url, retries=retries,
+                                          backoff=backoff, batch_size=batch_size, metrics=metrics):
+        if isinstance(report, HashScan.ScanError):
+            failures += 1
+            continue
+        verdicts += 1
+        #The stub's verdicts are fixed per hash, so any other answer is a client bug:
+        expected = make_report(file_hash)
+        if (report.get('response_code'), report.get('positives')) != (expected['response_code'], expected.get('positives')):
+            wrong += 1
+    elapsed = time.perf_counter() - started
+    latencies = sorted(metrics.latencies)
+    return {
+        'workers': workers,
+        'hashes_per_sec': verdicts / elapsed if elapsed else 0.0,
+        'p50_ms': percentile(latencies, 50) * 1000,
+        'p99_ms': percentile(latencies, 99) * 1000,
+        'requests': metrics.requests,
+        'retries': metrics.retries,
+        'failures': failures,
+        'wrong': wrong,
+        'efficiency': verdicts / (metrics.requests * batch_size) if metrics.requests else 0.0,
+    }
+
+
+def main():
+
+    #Parse the command-line arguments:
+    parser = argparse.ArgumentParser(description="Offline HashScan throughput benchmark")
+    parser.add_argument('--hashes', type=int, default=500, help="Number of random hashes to scan per run")
+    parser.add_argument('--concurrency', default='1,2,4,8,16', help="Comma-separated worker counts to try")
+    parser.add_argument('--batch-size', type=int, default=4, help="Hashes sent per API request")
+    parser.add_argument('--rate', type=int, default=0, help="Client-side requests per minute (0 = unlimited)")
+    parser.add_argument('--retries', type=int, default=5, help="Retries per request")
+    parser.add_argument('--backoff', type=float, default=0.05, help="Base backoff in seconds between retries")
+    parser.add_argument('--latency', type=float, default=20.0, help="Stub server latency in milliseconds")
+    parser.add_argument('--jitter', type=float, default=5.0, help="Stub server latency jitter in milliseconds")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="Fraction of stub requests that fail with HTTP 500")
+    parser.add_argument('--throttle-rate', type=float, default=0.0, help="Fraction of stub requests answered as rate limited")
+    parser.add_argument('--quota', type=int, default=0, help="Stub server requests per minute (0 = no quota)")
+    parser.add_argument('--limit-status', type=int, default=429, choices=[204, 429], help="Status the stub uses when rate limiting")
+    parser.add_argument('--max-resources', type=int, default=25, help="Most resources the stub answers per request")
+    parser.add_argument('--seed', type=int, default=0, help="Seed for the generated hashes")
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    hashes = [f"{rng.getrandbits(256):064x}" for _ in range(args.hashes)]
+    server = start_stub_server(latency=args.latency, jitter=args.jitter, error_rate=args.error_rate,
+                               throttle_rate=args.throttle_rate, quota=args.quota, limit_status=args.limit_status,
+                               max_resources=args.max_resources, retry_after=0)
+
+    print(f"Scanning {len(hashes)} hashes per run against {server.url} (batch size {args.batch_size})\n")
+    print("{:>8} {:>12} {:>9} {:>9} {:>9} {:>8} {:>9} {:>6} {:>11}".format(
+        "workers", "hashes/sec", "p50 ms", "p99 ms", "requests", "retries", "failures", "wrong", "efficiency"))
+    print("-" * 89)
+    try:
+        for workers in (int(w) for w in args.concurrency.split(',')):
+            row = run_once(hashes, server.url, workers, args.batch_size, args.rate, args.retries, args.backoff)
+            print("{workers:>8} {hashes_per_sec:>12.1f} {p50_ms:>9.1f} {p99_ms:>9.1f} {requests:>9} "
+                  "{retries:>8} {failures:>9} {wrong:>6} {efficiency:>10.1%}".format(**row))
+    finally:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -6,26 +6,144 @@ Author: Tim Johns
 Last Modified: 10/16/24
 """
 import numpy as np
+from model_io import save_model, load_model, update_attributes
+
+#Patterns learned between two checkpoints when learn is given a checkpoint path:
+CHECKPOINT_EVERY = 100
+
+#Most bytes learn and test use for one block of patterns or weight rows:
+BATCH_MEMORY = 64 << 20
+
+#Weight types: float64 is the original storage, the integer types saturate at their limits:
+WEIGHT_TYPES = ('float64', 'float32', 'int16', 'int8')
 
 class Hopfield():
 
-    def __init__(self, n):
+    def __init__(self, n, dtype='float64', low_rank=False):
         """
-        Constructs an n by n hopfield network.
+        Constructs an n by n hopfield network. dtype picks how the
+        weights are stored (see WEIGHT_TYPES). With low_rank the
+        weight matrix is never built: the learned patterns are kept
+        instead (k x n, as -1/+1) and u @ T is worked out from them.
         """
-        self._T = np.zeros((n,n))
+        if dtype not in WEIGHT_TYPES:
+            raise ValueError(f"dtype must be one of {', '.join(WEIGHT_TYPES)}")
+        self.n = n
+        if low_rank:
+            self._T = None
+            self._B = np.zeros((0, n), dtype=np.int8)
+        else:
+            self._T = np.zeros((n,n), dtype=dtype)
+            self._B = None
+        #Number of patterns learned so far:
+        self.learned = 0
+        #File the weights are memory-mapped from (see load):
+        self.model_path = None
 
-    def learn(self, data):
+    def learn(self, data, checkpoint=None, checkpoint_every=CHECKPOINT_EVERY):
         """
         Method that takes a 2D array of input patterns as a
         parameter and writes them into the hopfield network.
+        The patterns are added a block at a time as B.T @ B, with
+        B the block as -1/+1, which is the sum of their outer
+        products. With a checkpoint path the network is saved
+        there after every checkpoint_every patterns.
+        """
+        data = np.asarray(data)
+        step = checkpoint_every if checkpoint else max(1, BATCH_MEMORY // (4 * self.n))
+        for first in range(0, len(data), step):
+            #Bipolar (-1/+1) block of patterns:
+            B = 2 * data[first:first + step] - 1
+            if self._T is None:
+                self._B = np.concatenate([self._B, B.astype(np.int8)])
+            else:
+                self.add_outer_products(B.astype(np.float32))
+                #Remove diagonal (no self reinforcement)
+                np.fill_diagonal(self._T, 0)
+            self.learned += len(B)
+            if checkpoint:
+                self.save(checkpoint)
+
+    def add_outer_products(self, B):
+        """
+        Method that adds B.T @ B to the weights, a block of rows at a time
+        so the temporary product stays small; integer weights saturate.
+        Sums of -1/+1 products are whole numbers, so float32 is exact here.
+        """
+        rows = max(1, BATCH_MEMORY // (8 * self.n))
+        saturating = self._T.dtype.kind == 'i'
+        for start in range(0, self.n, rows):
+            block = slice(start, start + rows)
+            update = B[:, block].T @ B
+            if saturating:
+                info = np.iinfo(self._T.dtype)
+                self._T[block] = np.clip(self._T[block] + update, info.min, info.max)
+            else:
+                self._T[block] += update
+
+    def weigh(self, u):
+        """
+        Method that returns u @ T. In low-rank mode this is
+        (u @ B.T) @ B - k * u: B.T @ B has k on its diagonal,
+        which the weights have removed.
+        """
+        if self._T is None:
+            #int64 first: B is int8, so bool or int8 probes would overflow the products
+            u = np.asarray(u, dtype=np.int64)
+            return (self._B @ u) @ self._B - len(self._B) * u
+        if self._T.dtype == np.float64:
+            return np.dot(u, self._T)
+        #Other weight types are summed in float64 a block of rows at a time:
+        u = np.asarray(u)
+        total = np.zeros(self.n)
+        rows = max(1, BATCH_MEMORY // (8 * self.n))
+        for start in range(0, self.n, rows):
+            total += u[start:start + rows] @ self._T[start:start + rows].astype(np.float64)
+        return total
+
+    def save(self, path):
+        """
+        Method that saves the weight matrix (or the patterns in low-rank
+        mode) and learned count to a model_io file.
+        """
+        attributes = {'n': int(self.n), 'learned': int(self.learned), 'low_rank': self._T is None}
+        if self._T is None:
+            save_model(path, 'hopfield', attributes, {'B': self._B})
+        else:
+            save_model(path, 'hopfield', dict(attributes, dtype=self._T.dtype.name), {'T': self._T})
+
+    @classmethod
+    def load(cls, path, mmap_mode=None):
+        """
+        Method that loads a network saved with save. With mmap_mode
+        ('r', 'r+' or 'c') the weights are memory-mapped from the
+        file (zero copy) instead of read. With 'r+' learning updates
+        the weights in the file itself; call flush afterwards to
+        write the learned count back to it too.
+        """
+        _, attributes, arrays = load_model(path, 'hopfield', mmap_mode)
+        network = cls.__new__(cls)
+        network.n = attributes['n']
+        network._T = arrays.get('T')
+        network._B = arrays.get('B')
+        network.learned = attributes['learned']
+        network.model_path = path if mmap_mode == 'r+' else None
+        return network
+
+    def flush(self):
+        """
+        Method that writes the weights and learned count back to the
+        file the network was loaded from with mmap_mode='r+'. In
+        low-rank mode new patterns are not added to the mapped array,
+        so the network is saved to that file again instead.
         """
-        #Loop through array of patterns:
-        for a in data:
-            #Update the weights using outer product of the input pattern:
-            self._T += np.outer(2 * a - 1, 2 * a - 1)
-        #Remove diagonal (no self reinforcement)
-        np.fill_diagonal(self._T, 0)
+        if self.model_path is None:
+            return
+        if self._T is None:
+            self.save(self.model_path)
+        else:
+            self._T.flush()
+            update_attributes(self.model_path, {'learned': int(self.learned)})
 
     def test(self, u, iterations=5):
         """
@@ -34,7 +152,7 @@ class Hopfield():
         network to reconstruct it.
         """
         for _ in range(iterations):
-            u = (np.dot(u, self._T) > 0).astype(int)
+            u = (self.weigh(u) > 0).astype(int)
         return u
 
 
@@ -133,8 +251,9 @@ def main():
     print("\nConfusion matrix for 1000-element vectors with 25 percent noise:")
     #Create a 10x10000 input vector:
     input_vector = np.random.randint(2, size=(10, 10000))
-    #Create a new hopfield network and let it learn the new input data:
-    hopNet = Hopfield(10000)
+    #Create a new hopfield network and let it learn the new input data (low-rank, so the
+    #10000x10000 weight matrix is never built; recall is the same as with the full matrix):
+    hopNet = Hopfield(10000, low_rank=True)
     hopNet.learn(input_vector)
     #Create a noisy copy of the new input data and show the confusion matrix:
     noisy_vector = noisy_copy(input_vector, 0.25)
@@ -1,105 +1,1003 @@
 """
 Author Tim Johns (last modified July 17th, 2024)
-Program that mangles passwords listed in the rows in the first column of a 
-.csv file. The mangled passwords are returned in a .txt file called mang_out.txt.
+Program that mangles passwords listed in the rows in the first column of a
+.csv file. The mangled passwords are returned in a .txt file called mang_out.txt,
+or wherever -o/--output points (- for stdout, to pipe straight into a cracker).
+The wordlist is streamed and candidates are generated lazily, so memory use does
+not grow with the size of the input. --workers spreads the words over several
+processes in chunks; the output is the same as a single process for a given --seed,
+and stays in input order unless --unordered is given.
+
+Modes (--mode):
+    sample      -> the original behaviour: random substitutions and years, at most --budget
+                   (default 5) candidates per word. --seed makes the output reproducible.
+                   Runs on a precompiled ManglePlan (translate tables, one random draw per word)
+                   rather than the reference mangling_variations / append_and_prepend_years_* code.
+    exhaustive  -> every substitution x case x year combination, in a fixed order,
+                   cut off after --budget candidates per word if one is given.
+    rules       -> applies each rule of a hashcat rule file (--rules) to every word. Rules with
+                   functions hashcat only runs with -j/-k (rejections, memory) are skipped with a warning.
+--keyspace prints the number of candidates the chosen mode can produce and exits.
+
+Global dedup (--dedup), off by default since candidates are otherwise only unique per word:
+    exact       -> remembers a 64-bit fingerprint of every candidate written, up to --dedup-memory MiB;
+                   past that, candidates are still checked against what is stored but no longer added.
+    bloom       -> a --dedup-memory MiB Bloom filter; constant memory, but a small share of unique
+                   candidates is dropped as false positives (the rate is reported).
+The duplicate rate and memory used are printed to stderr at the end.
+
+--rank writes the most likely candidates first, scored by CandidateModel (year position and
+value, capitalization, substitution characters). The priors are built in, or learned from a
+list of cracked passwords with --train. Candidates are sorted within a --rank-window sized heap,
+so memory stays flat on any input.
 """
 
+import os
 import sys
+import re
+import math
+import heapq
 import random
 import string
+import hashlib
+import argparse
+from collections import deque
+from itertools import islice
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+# Character substitutions and replacements
+SUBSTITUTIONS = {
+    'a': ['@', '4'], 'e': ['3'], 'i': ['1', '!'], 'o': ['0'], 's': ['$', '5'],
+    't': ['+', '7'], 'l': ['|', '1'], 'b': ['8'], 'g': ['9']
+}
+
+# Default number of candidates kept per word in sample mode
+SAMPLE_BUDGET = 5
+
+# Random bits per variant for the year draws in sample mode, and how many variants' worth
+# are taken up front (a few more than the sample budget usually needs)
+YEAR_DRAW_BITS = 30
+YEAR_DRAW_MASK = (1 << YEAR_DRAW_BITS) - 1
+YEAR_DRAWS = 8
+
+# Output defaults: candidates are written CHUNK_LINES at a time through an OUT_BUFFER byte buffer
+DEFAULT_OUTPUT = 'mang_out.txt'
+CHUNK_LINES = 65536
+OUT_BUFFER = 1 << 20
+
+# Words per chunk handed to a worker process with --workers
+WORKER_CHUNK = 2000
+
+# Global dedup (--dedup): default memory for the filter, bytes per stored fingerprint in exact
+# mode (the int object; the set's own table is measured), how often the memory cap is checked,
+# and the bit positions set per candidate in the Bloom filter when no expected capacity is given
+DEDUP_MEMORY = 256 << 20
+FINGERPRINT_BYTES = sys.getsizeof(1 << 63)
+DEDUP_CHECK_EVERY = 65536
+BLOOM_HASHES = 7
+# Blocked Bloom filter layout: bytes per block (a cache line) and masks per pattern table
+BLOOM_BLOCK_BYTES = 64
+BLOOM_PATTERNS = 1 << 12
+
+# Ranked ordering (--rank): built-in priors of the candidate model, how strongly they hold against
+# a --train list (in passwords' worth of evidence), and candidates held in the ranking heap
+YEAR_POSITION_PRIOR = {'none': 0.70, 'suffix': 0.26, 'prefix': 0.03, 'both': 0.01}
+YEAR_PEAK = 1995
+YEAR_SPREAD = 12
+CASE_PRIOR = {'lower': 0.65, 'first': 0.25, 'upper': 0.04, 'last': 0.02, 'both': 0.02, 'mixed': 0.02}
+LEET_PRIOR = {'0': 0.08, '1': 0.08, '3': 0.06, '@': 0.06, '4': 0.04, '$': 0.04, '5': 0.03, '!': 0.03,
+              '7': 0.02, '9': 0.02, '8': 0.02, '+': 0.005, '|': 0.005}
+PRIOR_WEIGHT = 100
+RANK_WINDOW = 100000
 
 def generate_year_patterns():
     # Generate years from 1940 to 2024 inclusive
     return [str(year) for year in range(1940, 2025)]
 
 def generate_case_variations(word):
-    results = set()
+    # Kept in a dict rather than a set so the order is the same on every run
+    results = {}
 
     # Capitalize first letter of each word and/or last letter
     if word:
         # Capitalize first letter of the entire word
-        results.add(word.capitalize())
-        
+        results[word.capitalize()] = None
+
         # Capitalize last letter
-        results.add(word[:-1] + word[-1].upper())
-        
+        results[word[:-1] + word[-1].upper()] = None
+
         # Capitalize first and last letter
         if len(word) > 1:
-            results.add(word[0].upper() + word[1:-1] + word[-1].upper())
-        
+            results[word[0].upper() + word[1:-1] + word[-1].upper()] = None
+
         # Original word in lowercase
-        results.add(word.lower())
-    
-    return results
+        results[word.lower()] = None
+
+    return list(results)
 
-def mangling_variations(word):
-    variations = set()
+def case_variants(word):
+    # generate_case_variations without removing repeats, for callers that skip them anyway
+    if not word:
+        return ()
+    last = word[:-1] + word[-1].upper()
+    if len(word) > 1:
+        return word.capitalize(), last, word[0].upper() + word[1:-1] + word[-1].upper(), word.lower()
+    return word.capitalize(), last, word.lower()
 
-    # Define character substitutions and replacements
-    substitutions = {
-        'a': ['@', '4'], 'e': ['3'], 'i': ['1', '!'], 'o': ['0'], 's': ['$', '5'],
-        't': ['+', '7'], 'l': ['|', '1'], 'b': ['8'], 'g': ['9']
-    }
+def mangling_variations(word, rng=random):
+    variations = {}
 
     # Add original word
-    variations.add(word)
-    
+    variations[word] = None
+
     # Apply substitutions probabilistically
-    for char, reps in substitutions.items():
+    for char, reps in SUBSTITUTIONS.items():
         if char in word:
             for rep in reps:
-                if random.random() < 0.5:  # 50% chance to substitute
-                    variations.add(word.replace(char, rep))
-                
+                if rng.random() < 0.5:  # 50% chance to substitute
+                    variations[word.replace(char, rep)] = None
+
     # Apply multiple substitutions probabilistically
-    for char1, reps1 in substitutions.items():
-        for char2, reps2 in substitutions.items():
+    for char1, reps1 in SUBSTITUTIONS.items():
+        for char2, reps2 in SUBSTITUTIONS.items():
             if char1 != char2:
                 for rep1 in reps1:
                     for rep2 in reps2:
-                        if random.random() < 0.5:  # 50% chance to substitute both
+                        if rng.random() < 0.5:  # 50% chance to substitute both
                             new_word = word.replace(char1, rep1).replace(char2, rep2)
-                            variations.add(new_word)
-    
+                            variations[new_word] = None
+
     # Case variations with targeted capitalization
-    variations.update(generate_case_variations(word))
-    
+    variations.update(dict.fromkeys(generate_case_variations(word)))
+
     return list(variations)
 
-def append_and_prepend_years_probabilistically(variants):
+def append_and_prepend_years_probabilistically(variants, rng=random, limit=SAMPLE_BUDGET):
     year_patterns = generate_year_patterns()
-    final_variations = set()
+    final_variations = {}
 
     for var in variants:
         # 50% chance to prepend a year
-        if random.random() < 0.5:
-            year = random.choice(year_patterns)
-            final_variations.add(year + var)
-        
+        if rng.random() < 0.5:
+            year = rng.choice(year_patterns)
+            final_variations[year + var] = None
+
         # 50% chance to append a year
-        if random.random() < 0.5:
-            year = random.choice(year_patterns)
-            final_variations.add(var + year)
-    
-    return list(final_variations)[:5]
-
-def process_file(file_path):
-    with open(file_path, 'r') as file:
-        words = file.read().strip().split('\n')
-    
-    # Open 'mang_out.txt' for writing
-    with open('mang_out.txt', 'w') as out_file:
-        for word in words:
-            base_variations = mangling_variations(word)
-            final_variations = append_and_prepend_years_probabilistically(base_variations)
-            # Write each variant to the output file, each on a new line
-            for variant in final_variations:
-                out_file.write(f"{variant}\n")
+        if rng.random() < 0.5:
+            year = rng.choice(year_patterns)
+            final_variations[var + year] = None
+
+    return list(final_variations)[:limit]
+
+class WordRandom:
+    # Deterministic random bits for one word: a SHAKE-256 stream of "seed:word".
+    # Much cheaper to set up than a seeded random.Random, which matters when there is one per word.
+
+    __slots__ = ('key', 'stream', 'pos')
+
+    def __init__(self, key):
+        self.key = key.encode('utf-8', 'surrogatepass')
+        self.stream = b''
+        self.pos = 0
+
+    def getrandbits(self, k):
+        # The stream is only hashed once bits are asked for; SHAKE output is a prefix of any longer
+        # output, so extending it keeps the bits already handed out
+        size = (k + 7) // 8
+        if self.pos + size > len(self.stream):
+            self.stream = hashlib.shake_256(self.key).digest(max(64, 2 * len(self.stream) + size))
+        value = int.from_bytes(self.stream[self.pos:self.pos + size], 'little')
+        self.pos += size
+        return value >> (8 * size - k)
+
+def word_rng(word, seed):
+    # Each word gets its own generator seeded from (seed, word), so a word always mangles
+    # the same way for a given seed no matter where it sits in the input
+    if seed is None:
+        return random
+    return WordRandom(f"{seed}:{word}")
+
+# ------------------------------ Compiled plan ---------------------------------
+
+class ManglePlan:
+    # Everything about mangling that doesn't depend on the word, built once and reused:
+    # the year strings, str.translate tables for every substitution choice, and, for each set
+    # of substitutable characters a word can contain, which random draws lead to which table.
+
+    def __init__(self, substitutions=SUBSTITUTIONS, years=None):
+        self.substitutions = substitutions
+        self.keys = tuple(substitutions)
+        self.key_set = frozenset(substitutions)
+        self.years = tuple(years or generate_year_patterns())
+        self.year_pairs = tuple((prefix, suffix) for prefix in self.years for suffix in self.years)
+        self.year_choices = (('', ''),) + tuple(('', year) for year in self.years) + tuple((year, '') for year in self.years)
+
+        # One random bit per substitution mangling_variations draws for: every single (char, rep),
+        # then every ordered pair of different characters, in the same order as its loops
+        draws = [((char, rep),) for char, reps in substitutions.items() for rep in reps]
+        draws += [((char1, rep1), (char2, rep2))
+                  for char1, reps1 in substitutions.items() for char2, reps2 in substitutions.items()
+                  if char1 != char2 for rep1 in reps1 for rep2 in reps2]
+        self.draws = draws
+        self.bits = len(draws)
+
+        self._tables = {}
+        self._groups = {}
+        self._choices = {}
+
+    def present(self, word):
+        # The substitutable characters that occur in the word
+        return self.key_set.intersection(word)
+
+    def table(self, choice):
+        table = self._tables.get(choice)
+        if table is None:
+            table = self._tables[choice] = str.maketrans(dict(choice))
+        return table
+
+    def groups(self, present):
+        # For a set of present characters, (relevant, steps): the mask of draw bits that change the
+        # word, and for each of those bits (keep, char1, rep1, char2, rep2) of the substitution it produces,
+        # where keep clears every bit leading to that same substitution. Draws that only touch absent
+        # characters reduce to a smaller substitution or to the word itself.
+        groups = self._groups.get(present)
+        if groups is None:
+            relevant = 0
+            masks = {}
+            for bit, draw in enumerate(self.draws):
+                choice = tuple(sorted(pair for pair in draw if pair[0] in present))
+                if choice:
+                    relevant |= 1 << bit
+                    masks[choice] = masks.get(choice, 0) | 1 << bit
+            steps = {}
+            for choice, mask in masks.items():
+                # Replacements are never substitutable letters, so chained str.replace is the same as
+                # translating (and much faster for one or two characters); a single pair is repeated
+                (char1, rep1), (char2, rep2) = choice[0], choice[-1]
+                step = (~mask, char1, rep1, char2, rep2)
+                for bit in range(mask.bit_length()):
+                    if mask >> bit & 1:
+                        steps[bit] = step
+            groups = self._groups[present] = (relevant, steps)
+        return groups
+
+    def substitution_tables(self, word, max_subs=2):
+        # Translate tables for every way of substituting up to max_subs of the characters present
+        # in the word; None (no substitution) comes first
+        present = self.present(word)
+        tables = self._choices.get((present, max_subs))
+        if tables is None:
+            choices = [()]
+            for char, reps in self.substitutions.items():
+                if char in present:
+                    choices += [choice + ((char, rep),) for choice in choices if len(choice) < max_subs for rep in reps]
+            tables = self._choices[(present, max_subs)] = [None] + [self.table(choice) for choice in choices[1:]]
+        return tables
+
+    def sample(self, word, rng, limit=SAMPLE_BUDGET):
+        # Same distribution as append_and_prepend_years_probabilistically(mangling_variations(word)).
+        # One getrandbits call covers a bit per substitution draw (each succeeds with probability
+        # 1/2, like random.choice([True, False])) and the year draws of the first YEAR_DRAWS
+        # variants: bit 0 prepends, bit 1 appends, the rest picks the years. Variants come in the
+        # original order (word, successful substitutions lowest bit first, capitalizations) and
+        # candidates only ever get appended, so generation stops as soon as limit are collected.
+        relevant, steps = self.groups(self.key_set.intersection(word))
+        nbits = self.bits
+        bits = rng.getrandbits(nbits + YEAR_DRAW_BITS * YEAR_DRAWS)
+        draws = bits >> nbits
+        hits = bits & relevant
+        left = YEAR_DRAWS
+        year_pairs = self.year_pairs
+        pair_count = len(year_pairs)
+        final_variations = {}
+        seen = None
+        cases = None
+        var = word
+        while True:
+            if not left:
+                draws = rng.getrandbits(YEAR_DRAW_BITS * YEAR_DRAWS)
+                left = YEAR_DRAWS
+            draw = draws & YEAR_DRAW_MASK
+            draws >>= YEAR_DRAW_BITS
+            left -= 1
+            if draw & 3:
+                prefix, suffix = year_pairs[(draw >> 2) % pair_count]
+                if draw & 1:
+                    final_variations[prefix + var] = None
+                if draw & 2:
+                    final_variations[var + suffix] = None
+                if limit is not None and len(final_variations) >= limit:
+                    break
+
+            # Next variant: the next successful substitution (each one once: its other bits are
+            # cleared), then the capitalizations not already produced. A substitution puts a symbol
+            # or digit where the word has a letter, so it can never equal a capitalization.
+            if hits:
+                keep, char1, rep1, char2, rep2 = steps[(hits & -hits).bit_length() - 1]
+                hits &= keep
+                var = word.replace(char1, rep1).replace(char2, rep2)
+                continue
+            if cases is None:
+                cases = iter(case_variants(word))
+                seen = {word}
+            for var in cases:
+                if var not in seen:
+                    break
+            else:
+                break
+            seen.add(var)
+        return list(final_variations)[:limit]
+
+    def exhaustive(self, word, budget=None, max_subs=2):
+        # Builds each substituted/capitalized base once, then walks the year affixes over them
+        bases = []
+        for case in case_choices(word):
+            for table in self.substitution_tables(word, max_subs):
+                bases.append(case if table is None else case.translate(table))
+        seen = set()
+        for prefix, suffix in self.year_choices:
+            for base in bases:
+                candidate = prefix + base + suffix
+                if candidate in seen:
+                    continue
+                seen.add(candidate)
+                yield candidate
+                if budget is not None and len(seen) >= budget:
+                    return
+
+# The plan used by the module-level functions below
+PLAN = ManglePlan()
+
+# --------------------------- Exhaustive enumeration ---------------------------
+
+def case_choices(word):
+    # The word as given, then the targeted capitalizations, without repeats
+    return list(dict.fromkeys([word] + generate_case_variations(word)))
+
+def keyspace(word, max_subs=2):
+    # Number of (possibly repeated) candidates exhaustive mode enumerates for the word
+    return len(PLAN.substitution_tables(word, max_subs)) * len(case_choices(word)) * len(PLAN.year_choices)
+
+def exhaustive_candidates(word, budget=None, max_subs=2):
+    # Walks the substitution x case x year space in a fixed order (all candidates without
+    # a year first), skipping repeats, and stops after budget candidates
+    return PLAN.exhaustive(word, budget, max_subs)
+
+def sample_candidates(word, seed=None, budget=SAMPLE_BUDGET):
+    # The original probabilistic mangling, driven by the per-word generator and the compiled plan
+    return PLAN.sample(word, word_rng(word, seed), budget)
+
+# ------------------------------ Hashcat rules ---------------------------------
+
+def rule_position(char):
+    # Hashcat positions: 0-9 then A-Z for 10-35
+    if char.isdigit():
+        return int(char)
+    if 'A' <= char <= 'Z':
+        return ord(char) - ord('A') + 10
+    raise ValueError(f"Bad rule position: {char}")
+
+# Arguments of every supported rule function: N is a position (0-9, A-Z), X a character.
+# Rejection (< > _ ! / ( ) = % Q) and memory (M 4 6 X) functions are left out, as hashcat
+# only supports them with -j/-k and skips them in rule files.
+RULE_ARGS = {':': '', 'l': '', 'u': '', 'c': '', 'C': '', 't': '', 'r': '', 'd': '', 'f': '',
+             '{': '', '}': '', '[': '', ']': '', 'q': '', 'k': '', 'K': '', 'E': '',
+             'T': 'N', 'D': 'N', "'": 'N', 'z': 'N', 'Z': 'N', 'p': 'N', 'y': 'N', 'Y': 'N',
+             'L': 'N', 'R': 'N', '+': 'N', '-': 'N', '.': 'N', ',': 'N',
+             '$': 'X', '^': 'X', '@': 'X', 'e': 'X',
+             'i': 'NX', 'o': 'NX', 'x': 'NN', 'O': 'NN', '*': 'NN', 's': 'XX'}
+
+def parse_rule(rule):
+    # Splits a hashcat rule line into (function, arguments) steps, with positions as ints.
+    # Raises ValueError for unsupported functions and missing or bad arguments.
+    steps = []
+    i = 0
+    while i < len(rule):
+        function = rule[i]
+        if function == ' ':
+            i += 1
+            continue
+        if function not in RULE_ARGS:
+            raise ValueError(f"Unsupported rule function {function!r} in {rule!r}")
+        kinds = RULE_ARGS[function]
+        args = rule[i + 1:i + 1 + len(kinds)]
+        if len(args) != len(kinds):
+            raise ValueError(f"Missing argument for {function!r} in {rule!r}")
+        steps.append((function, tuple(rule_position(arg) if kind == 'N' else arg for kind, arg in zip(kinds, args))))
+        i += 1 + len(kinds)
+    return steps
+
+def shift_char(word, n, change):
+    # Replaces the character at n with change(its code) kept to a byte, as hashcat works on bytes
+    if n >= len(word) or ord(word[n]) > 0xFF:
+        return word
+    return word[:n] + chr(change(ord(word[n])) & 0xFF) + word[n + 1:]
+
+def title_case(word, separator):
+    # Lower cases the word, then upper cases its first letter and every letter after a separator
+    parts = word.lower().split(separator)
+    return separator.join(part[:1].upper() + part[1:] for part in parts)
+
+def apply_rule(word, steps):
+    # Applies parsed rule steps to a word, following hashcat's semantics: a position past the
+    # end of the word leaves it unchanged
+    for function, args in steps:
+        if function == 'l':
+            word = word.lower()
+        elif function == 'u':
+            word = word.upper()
+        elif function == 'c':
+            word = word[:1].upper() + word[1:].lower()
+        elif function == 'C':
+            word = word[:1].lower() + word[1:].upper()
+        elif function == 't':
+            word = word.swapcase()
+        elif function == 'T':
+            n, = args
+            if n < len(word):
+                word = word[:n] + word[n].swapcase() + word[n + 1:]
+        elif function == 'r':
+            word = word[::-1]
+        elif function == 'd':
+            word = word + word
+        elif function == 'p':
+            word = word * (args[0] + 1)
+        elif function == 'f':
+            word = word + word[::-1]
+        elif function == '{':
+            word = word[1:] + word[:1]
+        elif function == '}':
+            word = word[-1:] + word[:-1]
+        elif function == '[':
+            word = word[1:]
+        elif function == ']':
+            word = word[:-1]
+        elif function == 'q':
+            word = ''.join(char * 2 for char in word)
+        elif function == 'k':
+            word = word[1:2] + word[:1] + word[2:]
+        elif function == 'K':
+            if len(word) >= 2:
+                word = word[:-2] + word[-1] + word[-2]
+        elif function == 'E':
+            word = title_case(word, ' ')
+        elif function == 'e':
+            word = title_case(word, args[0])
+        elif function == 'D':
+            n, = args
+            if n < len(word):
+                word = word[:n] + word[n + 1:]
+        elif function == "'":
+            word = word[:args[0]]
+        elif function == 'z':
+            word = word[:1] * args[0] + word
+        elif function == 'Z':
+            word = word + word[-1:] * args[0]
+        elif function == 'y':
+            if args[0] <= len(word):
+                word = word[:args[0]] + word
+        elif function == 'Y':
+            if args[0] <= len(word):
+                word = word + word[len(word) - args[0]:]
+        elif function == 'L':
+            word = shift_char(word, args[0], lambda code: code << 1)
+        elif function == 'R':
+            word = shift_char(word, args[0], lambda code: code >> 1)
+        elif function == '+':
+            word = shift_char(word, args[0], lambda code: code + 1)
+        elif function == '-':
+            word = shift_char(word, args[0], lambda code: code - 1)
+        elif function == '.':
+            n, = args
+            if n + 1 < len(word):
+                word = word[:n] + word[n + 1] + word[n + 1:]
+        elif function == ',':
+            n, = args
+            if 1 <= n < len(word):
+                word = word[:n] + word[n - 1] + word[n + 1:]
+        elif function == 'i':
+            n, char = args
+            if n <= len(word):
+                word = word[:n] + char + word[n:]
+        elif function == 'o':
+            n, char = args
+            if n < len(word):
+                word = word[:n] + char + word[n + 1:]
+        elif function == 'x':
+            n, m = args
+            if n < len(word) and n + m <= len(word):
+                word = word[n:n + m]
+        elif function == 'O':
+            n, m = args
+            if n < len(word) and n + m <= len(word):
+                word = word[:n] + word[n + m:]
+        elif function == '*':
+            n, m = args
+            if n < len(word) and m < len(word):
+                chars = list(word)
+                chars[n], chars[m] = chars[m], chars[n]
+                word = ''.join(chars)
+        elif function == '$':
+            word = word + args[0]
+        elif function == '^':
+            word = args[0] + word
+        elif function == 's':
+            word = word.replace(args[0], args[1])
+        elif function == '@':
+            word = word.replace(args[0], '')
+    return word
+
+def load_rules(rules_path):
+    # Reads a hashcat .rule file, skipping blank lines and comments. Like hashcat, a rule
+    # that is unsupported or malformed is skipped with a warning instead of ending the run
+    rules = []
+    with open(rules_path, 'r') as file:
+        for number, line in enumerate(file, 1):
+            line = line.rstrip('\r\n')
+            if not line.strip() or line.startswith('#'):
+                continue
+            try:
+                rules.append(parse_rule(line))
+            except ValueError as e:
+                print(f"Skipping rule on line {number} of {rules_path}: {e}", file=sys.stderr)
+    return rules
+
+def rule_candidates(word, rules, budget=None):
+    seen = set()
+    for steps in rules:
+        candidate = apply_rule(word, steps)
+        if candidate in seen:
+            continue
+        seen.add(candidate)
+        yield candidate
+        if budget is not None and len(seen) >= budget:
+            return
+
+# ------------------------------------------------------------------------------
+
+def mangle_word(word, mode='sample', seed=None, budget=None, rules=None, max_subs=2):
+    # Yields the candidates for one word in the chosen mode
+    if mode == 'exhaustive':
+        return exhaustive_candidates(word, budget, max_subs)
+    if mode == 'rules':
+        return rule_candidates(word, rules, budget)
+    return sample_candidates(word, seed, SAMPLE_BUDGET if budget is None else budget)
+
+def mangle_words(words, mode='sample', seed=None, budget=None, rules=None, max_subs=2):
+    # Lazily yields the candidates for every word, one word at a time
+    for word in words:
+        yield from mangle_word(word, mode, seed, budget, rules, max_subs)
+
+def word_keyspace(word, mode='sample', budget=None, rules=None, max_subs=2):
+    # Most candidates the chosen mode can produce for the word
+    if mode == 'exhaustive':
+        space = keyspace(word, max_subs)
+    elif mode == 'rules':
+        space = len(rules)
+    else:
+        space = SAMPLE_BUDGET if budget is None else budget
+    return space if budget is None else min(space, budget)
+
+def iter_words(file_path):
+    # Streams the words one line at a time ('-' reads stdin), skipping blank lines
+    file = sys.stdin if file_path == '-' else open(file_path, 'r', buffering=OUT_BUFFER)
+    try:
+        for line in file:
+            word = line.rstrip('\r\n')
+            if word.strip():
+                yield word
+    finally:
+        if file is not sys.stdin:
+            file.close()
+
+def write_candidates(candidates, out_file, chunk_lines=CHUNK_LINES):
+    # Joins candidates into large blocks so there is one write per chunk_lines candidates
+    chunk = []
+    for candidate in candidates:
+        chunk.append(candidate)
+        if len(chunk) >= chunk_lines:
+            chunk.append('')
+            out_file.write('\n'.join(chunk))
+            chunk = []
+    if chunk:
+        chunk.append('')
+        out_file.write('\n'.join(chunk))
+
+def open_output(output_path):
+    # '-' writes to stdout, anything else is opened with a large write buffer
+    if output_path == '-':
+        return sys.stdout
+    return open(output_path, 'w', buffering=OUT_BUFFER)
+
+# ----------------------------- Global deduplication ---------------------------
+
+class ExactFilter:
+    # Drops candidates already written for any earlier word by remembering a 64-bit fingerprint
+    # of each one. Once the fingerprints take about max_bytes, new ones are no longer stored:
+    # later candidates are still checked against what is stored, but repeats among them get through.
+    kind = 'exact'
+
+    def __init__(self, max_bytes=DEDUP_MEMORY):
+        self.max_bytes = max_bytes
+        self.seen = set()
+        self.full = False
+        self.candidates = 0
+        self.duplicates = 0
+        self.unchecked = 0
+
+    def memory(self):
+        return sys.getsizeof(self.seen) + len(self.seen) * FINGERPRINT_BYTES
+
+    def next_check(self):
+        # Sets full once the cap is reached, otherwise returns how many fingerprints can be
+        # added before the memory needs measuring again (sooner as the cap gets closer)
+        room = self.max_bytes - self.memory()
+        self.full = room <= 0
+        return min(DEDUP_CHECK_EVERY, max(1, room // (4 * FINGERPRINT_BYTES)))
+
+    def unique(self, candidates):
+        seen = self.seen
+        blake2b = hashlib.blake2b
+        total = duplicates = unchecked = 0
+        until_check = self.next_check()
+        try:
+            for candidate in candidates:
+                total += 1
+                key = int.from_bytes(blake2b(candidate.encode('utf-8', 'surrogatepass'), digest_size=8).digest(), 'little')
+                if key in seen:
+                    duplicates += 1
+                    continue
+                if self.full:
+                    unchecked += 1
+                else:
+                    seen.add(key)
+                    until_check -= 1
+                    if not until_check:
+                        until_check = self.next_check()
+                yield candidate
+        finally:
+            self.candidates += total
+            self.duplicates += duplicates
+            self.unchecked += unchecked
+
+    def summary(self):
+        line = (f"dedup (exact): {self.candidates:,} candidates, {self.duplicates:,} duplicates removed "
+                f"({self.duplicates / max(self.candidates, 1):.2%}), {self.memory() / (1 << 20):,.1f} MiB used")
+        if self.full:
+            line += f"; memory cap reached, {self.unchecked:,} candidates written without being remembered"
+        return line
+
+class BloomFilter:
+    # Fixed-size Bloom filter for wordlists too big for ExactFilter. It is a blocked Bloom filter:
+    # a candidate's fingerprint picks one 512-bit block of the max_bytes and a mask of about k
+    # bits inside it (the OR of two precomputed patterns), so checking and setting the bits is
+    # a couple of big-int operations instead of k separate lookups. A unique candidate whose
+    # bits are all set already is dropped, so a small fraction is lost; summary() reports that
+    # false-positive rate. capacity (expected unique candidates) picks k.
+    kind = 'bloom'
+
+    def __init__(self, max_bytes=DEDUP_MEMORY, capacity=None):
+        self.blocks = max(1, int(max_bytes) // BLOOM_BLOCK_BYTES)
+        self.size = self.blocks * BLOOM_BLOCK_BYTES
+        self.bits = bytearray(self.size)
+        if capacity:
+            self.k = min(16, max(2, round(self.size * 8 / capacity * math.log(2))))
+        else:
+            self.k = BLOOM_HASHES
+        # Fixed seed: the same candidates are dropped on every run
+        rng = random.Random(self.k)
+        block_bits = range(BLOOM_BLOCK_BYTES * 8)
+        self.patterns = [[sum(1 << bit for bit in rng.sample(block_bits, k)) for _ in range(BLOOM_PATTERNS)]
+                         for k in ((self.k + 1) // 2, self.k // 2)]
+        self.candidates = 0
+        self.duplicates = 0
+        self.inserted = 0
+
+    def memory(self):
+        return self.size
+
+    def unique(self, candidates):
+        bits = self.bits
+        blocks = self.blocks
+        width = BLOOM_BLOCK_BYTES
+        low, high = self.patterns
+        pattern_mask = BLOOM_PATTERNS - 1
+        pattern_bits = BLOOM_PATTERNS.bit_length() - 1
+        blake2b = hashlib.blake2b
+        total = duplicates = 0
+        try:
+            for candidate in candidates:
+                total += 1
+                key = int.from_bytes(blake2b(candidate.encode('utf-8', 'surrogatepass'), digest_size=16).digest(), 'little')
+                mask = low[key & pattern_mask] | high[(key >> pattern_bits) & pattern_mask]
+                start = (key >> 2 * pattern_bits) % blocks * width
+                block = int.from_bytes(bits[start:start + width], 'little')
+                if block & mask == mask:
+                    duplicates += 1
+                    continue
+                bits[start:start + width] = (block | mask).to_bytes(width, 'little')
+                yield candidate
+        finally:
+            self.candidates += total
+            self.duplicates += duplicates
+            self.inserted += total - duplicates
+
+    def false_positive_rate(self):
+        # Chance that a new unique candidate is now taken for a duplicate: the number of candidates
+        # in its block is Poisson distributed, and each leaves a given bit clear with chance 1 - k/512
+        load = self.inserted / self.blocks
+        clear = 1 - self.k / (BLOOM_BLOCK_BYTES * 8)
+        rate = 0.0
+        weight = math.exp(-load)
+        for count in range(int(load + 12 * math.sqrt(load) + 20)):
+            rate += weight * (1 - clear ** count) ** self.k
+            weight *= load / (count + 1)
+        return rate
+
+    def summary(self):
+        return (f"dedup (bloom, k={self.k}): {self.candidates:,} candidates, {self.duplicates:,} duplicates removed "
+                f"({self.duplicates / max(self.candidates, 1):.2%}), {self.memory() / (1 << 20):,.1f} MiB used, "
+                f"false-positive rate now {self.false_positive_rate():.4%}")
+
+def make_filter(kind, max_bytes=DEDUP_MEMORY, capacity=None):
+    # The global dedup stage for --dedup, or None for 'off'
+    if kind == 'exact':
+        return ExactFilter(max_bytes)
+    if kind == 'bloom':
+        return BloomFilter(max_bytes, capacity)
+    return None
+
+# ------------------------------ Ranked ordering -------------------------------
+
+class CandidateModel:
+    # Lightweight model of how likely a candidate is as a password, scored from the candidate alone:
+    # where a year is attached (and which year), the capitalization of the rest, and which
+    # substitution characters it uses. Each part is a probability table; the score is the sum of
+    # their logs. The built-in priors are rough figures for leaked password lists; train() replaces
+    # them with counts from a list of cracked passwords, smoothed towards the priors.
+
+    def __init__(self):
+        self.years = PLAN.years
+        prefix = '|'.join(self.years)
+        self.pattern = re.compile(f"^({prefix})?(.*?)({prefix})?$", re.S)
+        self.leet_chars = frozenset(rep for reps in SUBSTITUTIONS.values() for rep in reps)
+        # Birth and graduation years dominate: a bump around the mid 90s rather than a flat spread
+        weights = {year: math.exp(-((int(year) - YEAR_PEAK) / YEAR_SPREAD) ** 2 / 2) + 0.01 for year in self.years}
+        total = sum(weights.values())
+        self.set_tables(dict(YEAR_POSITION_PRIOR), {year: w / total for year, w in weights.items()},
+                        dict(CASE_PRIOR), dict(LEET_PRIOR))
+
+    def set_tables(self, positions, years, cases, leet):
+        self.positions = positions
+        self.year_probs = years
+        self.cases = cases
+        self.leet = leet
+        self.log_positions = {key: math.log(p) for key, p in positions.items()}
+        self.log_years = {key: math.log(p) for key, p in years.items()}
+        self.log_cases = {key: math.log(p) for key, p in cases.items()}
+        # Used or not: only the odds matter for the ranking
+        self.log_leet = {key: math.log(p / (1 - p)) for key, p in leet.items()}
+
+    def features(self, candidate):
+        # (year position, year or None, case class, substitution characters used)
+        prefix, core, suffix = self.pattern.match(candidate).groups()
+        if prefix and suffix:
+            position, year = 'both', suffix
+        elif prefix or suffix:
+            position, year = ('prefix', prefix) if prefix else ('suffix', suffix)
+        else:
+            position, year = 'none', None
+        # Sorted so scores add up in the same order (and to the same float) in every process
+        leet = sorted(self.leet_chars.intersection(core)) if any(char.isalpha() for char in core) else ()
+        return position, year, case_class(core), leet
+
+    def score(self, candidate):
+        position, year, case, leet = self.features(candidate)
+        score = self.log_positions[position] + self.log_cases[case]
+        if year is not None:
+            score += self.log_years[year]
+        for char in leet:
+            score += self.log_leet[char]
+        return score
+
+    def train(self, passwords, weight=PRIOR_WEIGHT):
+        # Re-estimates every table from cracked passwords. Each table is smoothed towards the
+        # current one as if it had been seen weight times, so rare features never score -inf.
+        positions = dict.fromkeys(self.positions, 0)
+        years = dict.fromkeys(self.year_probs, 0)
+        cases = dict.fromkeys(self.cases, 0)
+        leet = dict.fromkeys(self.leet, 0)
+        count = dated = 0
+        for password in passwords:
+            position, year, case, used = self.features(password)
+            count += 1
+            positions[position] += 1
+            cases[case] += 1
+            if year is not None:
+                years[year] += 1
+                dated += 1
+            for char in used:
+                leet[char] += 1
+
+        def smooth(counts, prior, total):
+            return {key: (counts[key] + weight * prior[key]) / (total + weight) for key in prior}
+
+        # Substitution characters are independent yes/no features, not one distribution
+        self.set_tables(smooth(positions, self.positions, count), smooth(years, self.year_probs, dated),
+                        smooth(cases, self.cases, count),
+                        {char: (leet[char] + weight * p) / (count + weight) for char, p in self.leet.items()})
+        return count
+
+def case_class(core):
+    # How the letters of a candidate (without its year) are capitalized
+    if core == core.lower():
+        return 'lower'
+    if core == core.upper():
+        return 'upper'
+    head, middle, tail = core[:1], core[1:-1], core[-1:]
+    if head.isupper() and core[1:] == core[1:].lower():
+        return 'first'
+    if tail.isupper() and core[:-1] == core[:-1].lower():
+        return 'last'
+    if head.isupper() and tail.isupper() and middle == middle.lower():
+        return 'both'
+    return 'mixed'
+
+def rank_candidates(candidates, model, window=RANK_WINDOW):
+    # Emits candidates best score first using a heap of at most window candidates: once it is full,
+    # each new candidate pushes the best one out. The output is exactly sorted when the input fits
+    # in the window, and sorted within a sliding window otherwise, with memory staying flat.
+    # Ties keep their input order.
+    heap = []
+    score = model.score
+    for seq, candidate in enumerate(candidates):
+        entry = (-score(candidate), seq, candidate)
+        if len(heap) < window:
+            heapq.heappush(heap, entry)
+        else:
+            yield heapq.heappushpop(heap, entry)[2]
+    while heap:
+        yield heapq.heappop(heap)[2]
+
+# ------------------------------ Parallel mangling -----------------------------
+
+# Options for the words handed to this worker process, set once by init_worker
+_worker_options = None
+
+def init_worker(options):
+    global _worker_options
+    _worker_options = options
+    # Forked workers inherit the parent's random state, so unseeded runs need a fresh one each
+    random.seed()
+
+def mangle_chunk(words):
+    # Runs in a worker: mangles a chunk of words and returns the output as one block of text
+    candidates = list(mangle_words(words, *_worker_options))
+    candidates.append('')
+    return '\n'.join(candidates) if len(candidates) > 1 else ''
+
+def iter_chunks(words, chunk_size):
+    chunk = []
+    for word in words:
+        chunk.append(word)
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+def parallel_blocks(words, options, workers, chunk_size=WORKER_CHUNK, ordered=True):
+    # Splits the words into chunks, mangles them on a process pool and yields the output blocks.
+    # At most 2 * workers chunks are in flight, so memory stays bounded on huge inputs.
+    # ordered=True keeps the input order; ordered=False yields blocks as soon as they finish.
+    chunks = iter_chunks(words, chunk_size)
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(options,)) as pool:
+        pending = deque(pool.submit(mangle_chunk, chunk) for chunk in islice(chunks, 2 * workers))
+        while pending:
+            if ordered:
+                done = [pending.popleft()]
+            else:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    pending.remove(future)
+            for future in done:
+                yield future.result()
+            for chunk in islice(chunks, len(done)):
+                pending.append(pool.submit(mangle_chunk, chunk))
+
+def process_file(file_path, mode='sample', seed=None, budget=None, rules=None, max_subs=2,
+                 output_path=DEFAULT_OUTPUT, workers=1, ordered=True, chunk_size=WORKER_CHUNK, dedup=None,
+                 model=None, rank_window=RANK_WINDOW):
+    # dedup is an ExactFilter/BloomFilter (see make_filter) that every candidate goes through
+    # before being written, so repeats across words are dropped. With a CandidateModel, the
+    # candidates are then reordered best first (see rank_candidates). Both run in this process.
+    words = iter_words(file_path)
+    out_file = open_output(output_path)
+    try:
+        if workers > 1:
+            options = (mode, seed, budget, rules, max_subs)
+            blocks = parallel_blocks(words, options, workers, chunk_size, ordered)
+            if dedup is None and model is None:
+                for block in blocks:
+                    out_file.write(block)
+                return
+            candidates = (candidate for block in blocks for candidate in block.split('\n')[:-1])
+        else:
+            candidates = mangle_words(words, mode, seed, budget, rules, max_subs)
+        if dedup is not None:
+            candidates = dedup.unique(candidates)
+        if model is not None:
+            candidates = rank_candidates(candidates, model, rank_window)
+        write_candidates(candidates, out_file)
+    finally:
+        if out_file is sys.stdout:
+            out_file.flush()
+        else:
+            out_file.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Mangle the passwords in a wordlist.")
+    parser.add_argument('file_path', help="Wordlist (or one-column .csv) to mangle, or - for stdin")
+    parser.add_argument('-o', '--output', default=DEFAULT_OUTPUT,
+                        help="Where to write the candidates, or - for stdout (default: mang_out.txt)")
+    parser.add_argument('--mode', choices=['sample', 'exhaustive', 'rules'], default='sample',
+                        help="How candidates are generated (default: sample)")
+    parser.add_argument('--seed', help="Seed for sample mode; the same seed always gives the same output")
+    parser.add_argument('--budget', type=int, help="Most candidates per word (sample mode default: 5)")
+    parser.add_argument('--rules', help="Hashcat rule file for rules mode")
+    parser.add_argument('--max-subs', type=int, default=2,
+                        help="Most distinct characters substituted at once in exhaustive mode")
+    parser.add_argument('--keyspace', action='store_true', help="Print the candidate count and exit")
+    parser.add_argument('-w', '--workers', type=int, default=1,
+                        help="Worker processes to mangle with (0 = one per CPU core, default: 1)")
+    parser.add_argument('--unordered', action='store_true',
+                        help="With several workers, write each chunk as soon as it is done instead of in input order")
+    parser.add_argument('--chunk-size', type=int, default=WORKER_CHUNK, help="Words handed to a worker at a time")
+    parser.add_argument('--dedup', choices=['off', 'exact', 'bloom'], default='off',
+                        help="Drop candidates already written for an earlier word (default: off)")
+    parser.add_argument('--dedup-memory', type=int, default=DEDUP_MEMORY >> 20,
+                        help="MiB the dedup filter may use (default: 256)")
+    parser.add_argument('--dedup-capacity', type=int,
+                        help="Expected number of unique candidates, used to tune the Bloom filter")
+    parser.add_argument('--rank', action='store_true', help="Write the most likely candidates first")
+    parser.add_argument('--rank-window', type=int, default=RANK_WINDOW,
+                        help="Candidates held at once while ranking (default: 100000)")
+    parser.add_argument('--train', help="Cracked passwords to learn the ranking model from (implies --rank)")
+    args = parser.parse_args()
+    workers = args.workers or os.cpu_count() or 1
+
+    rules = None
+    if args.mode == 'rules':
+        if not args.rules:
+            parser.error("--mode rules needs --rules <file>")
+        try:
+            rules = load_rules(args.rules)
+        except (OSError, UnicodeDecodeError) as e:
+            parser.error(f"cannot read --rules file: {e}")
+        if not rules:
+            parser.error(f"{args.rules} has no supported rules")
+
+    if args.keyspace:
+        print(sum(word_keyspace(word, args.mode, args.budget, rules, args.max_subs)
+                  for word in iter_words(args.file_path)))
+        return
+
+    model = None
+    if args.rank or args.train:
+        model = CandidateModel()
+        if args.train:
+            model.train(iter_words(args.train))
+
+    dedup = make_filter(args.dedup, args.dedup_memory << 20, args.dedup_capacity)
+    try:
+        process_file(args.file_path, args.mode, args.seed, args.budget, rules, args.max_subs, args.output,
+                     workers, not args.unordered, args.chunk_size, dedup, model, args.rank_window)
+        if dedup is not None:
+            print(dedup.summary(), file=sys.stderr)
+    except BrokenPipeError:
+        # The cracker on the other end of the pipe stopped reading
+        sys.stderr.close()
+        sys.exit(0)
 
 if __name__ == "__main__":
-    if len(sys.argv) != 2:
-        print("Usage: python mangler.py <file_path>")
-        sys.exit(1)
-    
-    file_path = sys.argv[1]
-    process_file(file_path)
+    main()
@@ -0,0 +1,138 @@
+"""
+Benchmark for mangler.py that shows how words/sec scales with the number of worker processes.
+Requirements: Only the Python standard library.
+Input: An optional wordlist (a synthetic one is generated otherwise).
+Output: A table of words/sec, candidates/sec and speedup per worker count. Each run's output
+        is checked against the single-process run (same --seed), so a mismatch is reported.
+        --compare instead times sample mode per word on one core: the original
+        append_and_prepend_years_probabilistically(mangling_variations(word)) against the
+        compiled plan, seeded (--seed) and unseeded, with the speedup for each.
+Example Usage (in terminal):
+---
+$python3 mangler_bench.py
+$python3 mangler_bench.py --words 200000 --workers 1,2,4,8 --mode exhaustive --budget 100
+$python3 mangler_bench.py --wordlist rockyou.txt --workers 1,4,8
+$python3 mangler_bench.py --mode exhaustive --budget 100 --dedup exact
+$python3 mangler_bench.py --compare --words 20000
+---
+"""
+import os
+import time
+import random
+import string
+import hashlib
+import argparse
+import tempfile
+import mangler
+
+
+#Writes n random lowercase words (4-10 letters) to a temporary file and returns its path.
+def make_wordlist(n, seed):
+    rng = random.Random(seed)
+    fd, path = tempfile.mkstemp(suffix='.txt')
+    with os.fdopen(fd, 'w') as file:
+        for _ in range(n):
+            file.write(''.join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(4, 10))) + '\n')
+    return path
+
+
+#Runs mangler.process_file once and returns (seconds, output digest, candidate count).
+def run_once(wordlist, out_path, workers, args):
+    started = time.perf_counter()
+    mangler.process_file(wordlist, args.mode, args.seed, args.budget, None, 2, out_path, workers,
+                         not args.unordered, args.chunk_size, mangler.make_filter(args.dedup))
+    elapsed = time.perf_counter() - started
+    digest = hashlib.sha256()
+    lines = 0
+    with open(out_path, 'rb') as file:
+        for block in iter(lambda: file.read(1 << 20), b''):
+            digest.update(block)
+            lines += block.count(b'\n')
+    return elapsed, digest.hexdigest(), lines
+
+
+#Times fn(word) over every word, best of three passes, and returns microseconds per word.
+def time_per_word(fn, words):
+    best = None
+    for _ in range(3):
+        started = time.perf_counter()
+        for word in words:
+            fn(word)
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best / len(words) * 1e6
+
+
+#Prints the per-word cost of the original sample-mode functions and of the compiled plan.
+def compare(words, seed):
+    #Compile the plan's per-character-set tables first (a one-off cost per process):
+    for word in words:
+        mangler.sample_candidates(word, None)
+    original = time_per_word(
+        lambda word: mangler.append_and_prepend_years_probabilistically(mangler.mangling_variations(word)), words)
+    seeded = time_per_word(lambda word: mangler.sample_candidates(word, seed), words)
+    unseeded = time_per_word(lambda word: mangler.sample_candidates(word, None), words)
+    print(f"Sample mode on {len(words):,} words, one core\n")
+    print("{:>10} {:>12} {:>9}".format("version", "us/word", "speedup"))
+    print("-" * 33)
+    print("{:>10} {:>12.2f} {:>8.1f}x".format("original", original, 1.0))
+    print("{:>10} {:>12.2f} {:>8.1f}x".format("seeded", seeded, original / seeded))
+    print("{:>10} {:>12.2f} {:>8.1f}x".format("unseeded", unseeded, original / unseeded))
+
+
+def main():
+
+    #Parse the command-line arguments:
+    parser = argparse.ArgumentParser(description="mangler.py multi-core scaling benchmark")
+    parser.add_argument('--wordlist', help="Wordlist to mangle (default: a generated one)")
+    parser.add_argument('--words', type=int, default=50000, help="Size of the generated wordlist")
+    parser.add_argument('--workers', default=f"1,2,4,{os.cpu_count() or 1}", help="Comma-separated worker counts")
+    parser.add_argument('--mode', choices=['sample', 'exhaustive'], default='sample', help="Mangling mode")
+    parser.add_argument('--budget', type=int, help="Candidates per word")
+    parser.add_argument('--seed', default='bench', help="Seed for sample mode")
+    parser.add_argument('--chunk-size', type=int, default=mangler.WORKER_CHUNK, help="Words per worker chunk")
+    parser.add_argument('--unordered', action='store_true', help="Let workers write chunks out of order")
+    parser.add_argument('--dedup', choices=['off', 'exact', 'bloom'], default='off', help="Global dedup stage")
+    parser.add_argument('--compare', action='store_true', help="Time the compiled sample plan against the original functions")
+    args = parser.parse_args()
+
+    if args.compare:
+        if args.wordlist:
+            words = list(mangler.iter_words(args.wordlist))
+        else:
+            path = make_wordlist(args.words, 0)
+            words = list(mangler.iter_words(path))
+            os.remove(path)
+        compare(words, args.seed)
+        return
+
+    wordlist = args.wordlist or make_wordlist(args.words, 0)
+    with open(wordlist, 'r') as file:
+        word_count = sum(1 for line in file if line.strip())
+    fd, out_path = tempfile.mkstemp(suffix='.txt')
+    os.close(fd)
+
+    print(f"Mangling {word_count:,} words in {args.mode} mode on a {os.cpu_count()}-core machine\n")
+    print("{:>8} {:>10} {:>12} {:>16} {:>9}  {}".format(
+        "workers", "seconds", "words/sec", "candidates/sec", "speedup", "output"))
+    print("-" * 72)
+    baseline_time = baseline_digest = None
+    try:
+        for workers in sorted({int(w) for w in args.workers.split(',')}):
+            elapsed, digest, lines = run_once(wordlist, out_path, workers, args)
+            if baseline_time is None:
+                baseline_time, baseline_digest = elapsed, digest
+            if args.unordered and workers > 1:
+                check = "unordered"
+            else:
+                check = "identical" if digest == baseline_digest else "MISMATCH"
+            print("{:>8} {:>10.2f} {:>12,.0f} {:>16,.0f} {:>8.2f}x  {}".format(
+                workers, elapsed, word_count / elapsed, lines / elapsed, baseline_time / elapsed, check))
+    finally:
+        os.remove(out_path)
+        if not args.wordlist:
+            os.remove(wordlist)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,123 @@
+"""
+Versioned binary save/load for the numpy models (sdm.SDM, hopfield.Hopfield).
+Requirements: NumPy.
+Format: an 8-byte magic, the format version and the header length (two little-endian uint32),
+        then a JSON header with the model kind, its attributes and, for every array, its
+        dtype, shape and byte offset. Each array is stored raw (C order) at a page-aligned
+        offset, so load_model can memory-map it in place instead of reading it (zero copy).
+Example Usage (in python):
+---
+>>> save_model('net.model', 'hopfield', {'n': 30}, {'T': T})
+>>> kind, attributes, arrays = load_model('net.model', mmap_mode='r')
+>>> update_attributes('net.model', {'learned': 12})
+---
+"""
+import os
+import json
+import struct
+import numpy as np
+
+MAGIC = b'NPMODEL\0'
+VERSION = 1
+#Arrays start on page boundaries so they can be memory-mapped:
+ALIGNMENT = 4096
+#Rows written at a time when saving, so memory-mapped arrays are not read in whole:
+WRITE_BYTES = 64 << 20
+
+PREFIX = struct.Struct('<8sII')
+
+
+def aligned(offset):
+    return -(-offset // ALIGNMENT) * ALIGNMENT
+
+
+def save_model(path, kind, attributes, arrays):
+    """
+    Writes a model to path: attributes must be JSON values, arrays a dict of
+    name -> numpy array. The file is written next to path and then renamed
+    over it, so an interrupted save (or checkpoint) never leaves a broken file.
+    """
+    layout = {}
+    header = {'kind': kind, 'attributes': attributes, 'arrays': layout}
+    #Arrays go after the header, each starting on a page boundary:
+    start = aligned(PREFIX.size)
+    while True:
+        offset = start
+        for name, array in arrays.items():
+            layout[name] = {'dtype': array.dtype.str, 'shape': list(array.shape), 'offset': offset}
+            offset = aligned(offset + array.nbytes)
+        encoded = json.dumps(header).encode()
+        if PREFIX.size + len(encoded) <= start:
+            break
+        start = aligned(PREFIX.size + len(encoded))
+
+    temporary = path + '.tmp'
+    with open(temporary, 'wb') as file:
+        file.write(PREFIX.pack(MAGIC, VERSION, len(encoded)))
+        file.write(encoded)
+        for name, array in arrays.items():
+            file.seek(layout[name]['offset'])
+            if array.ndim == 0 or len(array) == 0:
+                file.write(np.ascontiguousarray(array).tobytes())
+                continue
+            step = max(1, WRITE_BYTES // max(1, array[:1].nbytes))
+            for first in range(0, len(array), step):
+                file.write(np.ascontiguousarray(array[first:first + step]).tobytes())
+        file.truncate(offset)
+    os.replace(temporary, path)
+
+
+def read_header(file, path, kind=None):
+    """Reads the version and JSON header of an open model file."""
+    prefix = file.read(PREFIX.size)
+    if len(prefix) < PREFIX.size or prefix[:8] != MAGIC:
+        raise ValueError(f"{path} is not a saved model")
+    _, version, length = PREFIX.unpack(prefix)
+    if version > VERSION:
+        raise ValueError(f"{path} is model format version {version}, this version reads up to {VERSION}")
+    header = json.loads(file.read(length))
+    if kind is not None and header['kind'] != kind:
+        raise ValueError(f"{path} holds a {header['kind']} model, not {kind}")
+    return version, header
+
+
+def load_model(path, kind=None, mmap_mode=None):
+    """
+    Reads a model written by save_model and returns (kind, attributes, arrays).
+    With mmap_mode ('r', 'r+' or 'c', as for np.memmap) the arrays are mapped
+    from the file instead of read; 'r+' writes changes straight back to it.
+    The attributes are not mapped: write changed ones back with update_attributes.
+    Raises ValueError for files that are not models, of another kind, or of a
+    newer version.
+    """
+    with open(path, 'rb') as file:
+        _, header = read_header(file, path, kind)
+        arrays = {}
+        for name, entry in header['arrays'].items():
+            dtype, shape = np.dtype(entry['dtype']), tuple(entry['shape'])
+            if mmap_mode is not None and 0 not in shape:
+                arrays[name] = np.memmap(path, dtype, mmap_mode, entry['offset'], shape)
+            else:
+                file.seek(entry['offset'])
+                arrays[name] = np.fromfile(file, dtype, int(np.prod(shape))).reshape(shape)
+    return header['kind'], header['attributes'], arrays
+
+
+def update_attributes(path, attributes):
+    """
+    Changes attributes of a saved model in place, without rewriting its
+    arrays: for models loaded with mmap_mode='r+', whose arrays are updated
+    in the file but whose attributes (such as the learned count) are not.
+    Raises ValueError if the new header does not fit before the first array;
+    save the model again with save_model then.
+    """
+    with open(path, 'r+b') as file:
+        version, header = read_header(file, path)
+        header['attributes'].update(attributes)
+        encoded = json.dumps(header).encode()
+        first = min((entry['offset'] for entry in header['arrays'].values()), default=None)
+        if first is not None and PREFIX.size + len(encoded) > first:
+            raise ValueError(f"the new attributes do not fit in the header of {path}; save the model again")
+        file.seek(0)
+        file.write(PREFIX.pack(MAGIC, version, len(encoded)))
+        file.write(encoded)
@@ -1,37 +1,290 @@
 """
 
 """
+import os
+import json
 import numpy as np
+from numpy.lib.format import open_memmap
+from model_io import save_model, load_model, update_attributes
+
+#Most bytes a batched enter/lookup uses for one block of its activation matrix and writes:
+BATCH_MEMORY = 64 << 20
+
+#Most bytes of random address bits drawn at a time when an SDM is created:
+ADDRESS_MEMORY = 16 << 20
+
+#Counter types: float64 is the original unbounded storage, the integer types saturate at their limits:
+COUNTER_TYPES = ('float64', 'int8', 'int16', 'int32')
+
+#Files of an SDM stored on disk (see SDM.open):
+SETTINGS_FILE = 'sdm.json'
+ADDRESS_FILE = 'addresses.npy'
+DATA_FILE = 'data.npy'
+
+#Patterns learned between two checkpoints when learn is given a checkpoint path:
+CHECKPOINT_EVERY = 1000
+
+#An indexed lookup falls back to the full scan when its buckets hold more than this share of the locations:
+INDEX_SCAN_FRACTION = 0.05
+
+#Number of set bits in every byte value, for counting bits when np.bitwise_count (NumPy 2.0+) is missing:
+POPCOUNT = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
 
 class SDM:
 
-    def __init__(self, p, n):
+    def __init__(self, p, n, dtype='float64', path=None, index_bits=None):
         """
         Constructor that initializes the SDM with random addresses and zeroed data storage.
+        Addresses are kept bit-packed, and dtype picks the counters (see COUNTER_TYPES).
+        With a path, both are np.memmap arrays in that directory, so the SDM can be
+        larger than memory and reopened later with SDM.open. index_bits (8 or 16)
+        builds an AddressIndex for lookups with small radii.
         """
         #Initialize the number of addresses:
         self.p = p
         #Initialize length of addresses:
         self.n = n
-        #Initialize array of random addresses:
-        self.addresses = np.random.randint(0, 2, (p, n))
-        #Initialize array of data storage with zeros:
-        self.data = np.zeros((p, n))
         #Initialize value for the radius:
         self.radius = 0.451 * n
+        #Initialize the count of entered patterns:
+        self.learned = 0
+        #Initialize array of data storage with zeros (memory-mapped when a path is given):
+        if dtype not in COUNTER_TYPES:
+            raise ValueError(f"dtype must be one of {', '.join(COUNTER_TYPES)}")
+        self.path = path
+        self.model_path = None
+        if path is None:
+            self.packed_addresses = np.zeros((p, packed_width(n)), dtype=np.uint8)
+            self.data = np.zeros((p, n), dtype=dtype)
+        else:
+            os.makedirs(path, exist_ok=True)
+            self.packed_addresses = open_memmap(os.path.join(path, ADDRESS_FILE), 'w+', np.uint8, (p, packed_width(n)))
+            self.data = open_memmap(os.path.join(path, DATA_FILE), 'w+', dtype, (p, n))
+        #Initialize array of random addresses, drawn as packed random bytes a chunk of rows at a time
+        #(the bits past n in the last byte are cleared, and the padding bytes stay zero):
+        width = -(-n // 8)
+        chunk = max(1, ADDRESS_MEMORY // width)
+        for start in range(0, p, chunk):
+            rows = slice(start, min(start + chunk, p))
+            self.packed_addresses[rows, :width] = np.random.randint(0, 256, (rows.stop - start, width), dtype=np.uint8)
+            if n % 8:
+                self.packed_addresses[rows, width - 1] &= 0xFF << (8 - n % 8) & 0xFF
+        self.index = AddressIndex(self.packed_addresses, n, index_bits) if index_bits else None
+        self.save_settings()
+
+    @classmethod
+    def open(cls, path, mode='r+', index_bits=None):
+        """
+        Reopens an SDM created with a path, memory-mapping its addresses
+        and counters instead of reading them into memory.
+        """
+        with open(os.path.join(path, SETTINGS_FILE)) as file:
+            settings = json.load(file)
+        sdm = cls.__new__(cls)
+        sdm.p, sdm.n, sdm.radius, sdm.path = settings['p'], settings['n'], settings['radius'], path
+        sdm.learned = settings.get('learned', 0)
+        sdm.model_path = None
+        sdm.packed_addresses = np.load(os.path.join(path, ADDRESS_FILE), mmap_mode=mode)
+        sdm.data = np.load(os.path.join(path, DATA_FILE), mmap_mode=mode)
+        sdm.index = AddressIndex(sdm.packed_addresses, sdm.n, index_bits) if index_bits else None
+        return sdm
+
+    def settings(self):
+        """
+        Returns p, n, the radius and the learned count as plain JSON
+        values (they may have been given as numpy scalars).
+        """
+        return {'p': int(self.p), 'n': int(self.n), 'radius': float(self.radius), 'learned': int(self.learned)}
+
+    def save_settings(self):
+        """
+        Writes p, n, the radius and the learned count next to the memory-mapped arrays.
+        """
+        if self.path is not None:
+            with open(os.path.join(self.path, SETTINGS_FILE), 'w') as file:
+                json.dump(self.settings(), file)
+
+    def save(self, path):
+        """
+        Saves the addresses, counters, radius and learned count to a model_io file.
+        """
+        save_model(path, 'sdm', self.settings(), {'addresses': self.packed_addresses, 'data': self.data})
+
+    @classmethod
+    def load(cls, path, mmap_mode=None, index_bits=None):
+        """
+        Loads an SDM saved with save. With mmap_mode ('r', 'r+' or 'c') the
+        addresses and counters are memory-mapped from the file (zero copy)
+        instead of read; with 'r+' entering patterns updates the counters in
+        the file itself, and flush also writes the learned count back to it.
+        """
+        _, attributes, arrays = load_model(path, 'sdm', mmap_mode)
+        sdm = cls.__new__(cls)
+        sdm.p, sdm.n, sdm.radius, sdm.learned = (attributes[key] for key in ('p', 'n', 'radius', 'learned'))
+        sdm.path = None
+        sdm.model_path = path if mmap_mode == 'r+' else None
+        sdm.packed_addresses, sdm.data = arrays['addresses'], arrays['data']
+        sdm.index = AddressIndex(sdm.packed_addresses, sdm.n, index_bits) if index_bits else None
+        return sdm
+
+    def flush(self):
+        """
+        Writes the memory-mapped arrays and settings back to disk.
+        """
+        if self.path is not None:
+            self.data.flush()
+            self.packed_addresses.flush()
+            self.save_settings()
+        if self.model_path is not None:
+            self.data.flush()
+            update_attributes(self.model_path, {'learned': int(self.learned)})
+
+    @property
+    def addresses(self):
+        """
+        The addresses as a (p x n) array of ones and zeros, unpacked from packed_addresses.
+        """
+        return np.unpackbits(self.packed_addresses, axis=1, count=self.n)
+
+    @addresses.setter
+    def addresses(self, addresses):
+        self.packed_addresses[:] = pack_bits(addresses)
+        if self.index is not None:
+            self.index = AddressIndex(self.packed_addresses, self.n, self.index.bits)
+
+    @property
+    def limits(self):
+        """
+        (lowest, highest) value of saturating integer counters, None for float counters.
+        """
+        if self.data.dtype.kind != 'i':
+            return None
+        info = np.iinfo(self.data.dtype)
+        return info.min, info.max
+
+    def distances(self, addressVector):
+        """
+        This method returns the Hamming distance between the address vector
+        and every physical address, computed on the bit-packed addresses.
+        """
+        return hamming_distances(self.packed_addresses, pack_bits(addressVector))
+
+    def activated(self, addressVector):
+        """
+        This method returns the (sorted) rows of every physical address within
+        the radius of the address vector, through the index when there is one.
+        """
+        if self.index is not None:
+            rows = self.index.activated(pack_bits(addressVector), self.radius)
+            if rows is not None:
+                return rows
+        return np.flatnonzero(self.distances(addressVector) <= self.radius)
+
+    def add(self, rows, update):
+        """
+        This method adds update to the data of the given rows, saturating integer counters.
+        """
+        limits = self.limits
+        if limits is None:
+            self.data[rows] += update
+        else:
+            self.data[rows] = np.clip(self.data[rows] + update, *limits)
 
     def enter(self, addressVector):
         """
         This method 'enters' the info in an address vector into the sdm's data array
         by finding all the addresses within the radius of the given address vector, and then writing 
         the given address's info to the physical address's data by adding or subtracting 1
-        based on the value in the addressVector.
+        based on the value in the addressVector. Gives the same data as enter_naive.
+        """
+        #Add 1 where the address vector has a 1 and subtract 1 elsewhere, on all activated rows at once:
+        self.add(self.activated(addressVector), np.where(np.asarray(addressVector) == 1, 1, -1))
+        self.learned += 1
+
+    def lookup(self, addressVector):
+        """
+        This method 'looks up' the information stored in the data vector
+        of the sdm finding all the addresses within the neighborhood of the
+        given address vector, and then adding each bit in the data to the retrieved data vector.
+        The information stored in that retrieved vector is then converted to 
+        ones and zeros for output. Gives the same result as lookup_naive.
+        """
+        #Sum the data of every physical address within the radius:
+        retrieved_data = self.data[self.activated(addressVector)].sum(axis=0, dtype=np.float64)
+        #Convert the retrieved data to ones (positive or zero) and zeros (negative):
+        return np.where(retrieved_data >= 0, 1.0, 0.0)
+
+    def blocks(self, X, batch_memory=BATCH_MEMORY):
+        """
+        This method yields (location slice, pattern slice, activation matrix, patterns)
+        for blocks of hard locations and patterns, where the activation matrix says which
+        of the patterns (rows) activate which of the locations (columns) and patterns is
+        the block's rows of X as float32 ones and zeros. Distances come from one matrix
+        product per block, |x| + |a| - 2 x.a, so a block's rows and columns are sized to
+        keep it within batch_memory bytes. Patterns are converted a block at a time, so
+        nothing the size of X is allocated.
+        """
+        X = np.asarray(X)
+        k = len(X)
+        #Float32 throughout; sums of 0/1 products stay exact up to 2^24 bits:
+        location_rows = max(1, min(self.p, batch_memory // (8 * self.n)))
+        pattern_rows = max(1, min(k, batch_memory // (8 * location_rows), batch_memory // (8 * self.n)))
+        radius = np.floor(self.radius)
+        for start in range(0, self.p, location_rows):
+            locations = slice(start, min(start + location_rows, self.p))
+            addresses = np.unpackbits(self.packed_addresses[locations], axis=1, count=self.n).astype(np.float32)
+            address_weights = addresses.sum(axis=1)
+            for first in range(0, k, pattern_rows):
+                patterns = slice(first, min(first + pattern_rows, k))
+                ones = (X[patterns] == 1).astype(np.float32)
+                overlap = ones @ addresses.T
+                overlap *= 2
+                overlap -= address_weights
+                #The distances are whole numbers, so d <= radius is 2 x.a - |a| >= |x| - floor(radius):
+                yield locations, patterns, overlap >= (ones.sum(axis=1) - radius)[:, None], ones
+
+    def enter_batch(self, X, batch_memory=BATCH_MEMORY):
+        """
+        This method enters every row of a (k x n) matrix of address vectors,
+        giving the same data as calling enter on each row. For each block the
+        writes are one matrix product: the activation matrix (transposed) times
+        the patterns as +1/-1. Saturating counters are clipped once per block,
+        so they can differ from row-by-row entering at their limits.
+        """
+        for locations, patterns, active, ones in self.blocks(X, batch_memory):
+            #The block's patterns as +1/-1, made in place (blocks is done with them):
+            ones *= 2
+            ones -= 1
+            self.add(locations, active.T.astype(np.float32) @ ones)
+        self.learned += len(X)
+
+    def lookup_batch(self, X, batch_memory=BATCH_MEMORY):
+        """
+        This method looks up every row of a (k x n) matrix of address vectors
+        and returns a (k x n) matrix of retrieved ones and zeros, the same as
+        calling lookup on each row. Each block's sums are one matrix product:
+        the activation matrix times the activated locations' data.
+        """
+        retrieved_data = np.zeros((len(X), self.n))
+        for locations, patterns, active, _ in self.blocks(X, batch_memory):
+            retrieved_data[patterns] += active.astype(np.float64) @ self.data[locations].astype(np.float64)
+        #Ones (positive or zero) and zeros (negative), in place:
+        return np.heaviside(retrieved_data, 1.0, out=retrieved_data)
+
+    def enter_naive(self, addressVector):
+        """
+        This method 'enters' the info in an address vector into the sdm's data array
+        by finding all the addresses within the radius of the given address vector, and then writing 
+        the given address's info to the physical address's data by adding or subtracting 1
+        based on the value in the addressVector. This is the original loop over
+        every address and bit, kept for checking and benchmarking enter.
         """
         #Loop through the sdm's array of addresses:
+        addresses = self.addresses
         for i in range(self.p):
 
             #Compute the Hamming distance between the address vector and the current physical address:
-            hdist = hamming_distance(self.addresses[i], addressVector)
+            hdist = hamming_distance(addresses[i], addressVector)
 
             #Check if the Hamming distance is within the radius:
             if hdist <= self.radius:
@@ -43,24 +296,27 @@ class SDM:
                     else:
                         #If the bit in the address vector is 0, subtract 1 from the data vector:
                         self.data[i][j] -= 1
+        self.learned += 1
 
 
-    def lookup(self, addressVector):
+    def lookup_naive(self, addressVector):
         """
         This method 'looks up' the information stored in the data vector
         of the sdm finding all the addresses within the neighborhood of the
         given address vector, and then adding each bit in the data to the retrieved data vector.
         The information stored in that retrieved vector is then converted to 
-        ones and zeros for output.
+        ones and zeros for output. This is the original loop over every
+        address and bit, kept for checking and benchmarking lookup.
         """
         #Initialze array of 0s for retrieved data:
         retrieved_data = np.zeros(self.n)
 
         #Loop through the addresses:
+        addresses = self.addresses
         for i in range(self.p):
 
             #Compute the Hamming distance between the address vector and the current physical address:
-            hdist = hamming_distance(self.addresses[i], addressVector)
+            hdist = hamming_distance(addresses[i], addressVector)
 
             #Check if the Hamming distance is within the radius:
             if hdist <= self.radius:
@@ -80,20 +336,27 @@ class SDM:
         return retrieved_data
     
 
-    def learn(self, iterations, probability):
+    def learn(self, iterations, probability, checkpoint=None, checkpoint_every=CHECKPOINT_EVERY):
         """
         This method enters a specified number of noisy rings into
         the sdm. Each ring is as noisy as is specified by the
-        probability parameter.
+        probability parameter. With a checkpoint path the sdm is
+        saved there after every checkpoint_every rings.
         """
-        #Enter a pattern for each desired iteration:
+        patterns = []
+        #Make a pattern for each desired iteration:
         for x in range(iterations):
             #Get a noisy ring:
             data = noisy_copy(ring(), probability)
             plot(data, 16)
             print()
-            #Enter the ring into the sdm:
-            self.enter(data)
+            patterns.append(data)
+        #Enter the rings into the sdm at once, or a checkpoint's worth at a time:
+        every = checkpoint_every if checkpoint else max(1, len(patterns))
+        for first in range(0, len(patterns), every):
+            self.enter_batch(patterns[first:first + every])
+            if checkpoint:
+                self.save(checkpoint)
 
 
     def test(self, noisyArray):
@@ -106,6 +369,72 @@ class SDM:
 
 
 
+class AddressIndex:
+
+    def __init__(self, packed_addresses, n, bits=16):
+        """
+        Multi-index hashing over the packed addresses: they are cut into
+        m = ceil(n / bits) substrings, and for each substring position the
+        rows are grouped (sorted) by substring value. Any address within a
+        distance d of a key differs from it in at most floor(d / m) bits in at
+        least one substring, so only the buckets within that many bits of the
+        key's substrings have to be checked.
+        """
+        if bits not in (8, 16):
+            raise ValueError("index bits must be 8 or 16")
+        self.bits = bits
+        self.m = -(-n // bits)
+        self.p = len(packed_addresses)
+        self.packed_addresses = packed_addresses
+        #One list of rows sorted by substring value per position, concatenated, with each bucket's start:
+        substrings = self.substrings(packed_addresses)
+        self.rows = np.empty(self.m * self.p, dtype=np.int32 if self.p < 1 << 31 else np.int64)
+        self.starts = np.empty((self.m, (1 << bits) + 1), dtype=np.int64)
+        for j in range(self.m):
+            values = substrings[:, j]
+            self.rows[j * self.p:(j + 1) * self.p] = np.argsort(values, kind='stable')
+            self.starts[j, 0] = j * self.p
+            np.cumsum(np.bincount(values, minlength=1 << bits), out=self.starts[j, 1:])
+            self.starts[j, 1:] += j * self.p
+        values = np.arange(1 << bits)
+        self.weights = POPCOUNT[values & 255] + POPCOUNT[values >> 8]
+        self.masks = {}
+
+    def substrings(self, packed):
+        """
+        Returns the substring values (as many columns as there are substrings) of packed vectors.
+        """
+        packed = np.atleast_2d(packed)
+        if self.bits == 8:
+            return packed[:, :self.m].astype(np.int64)
+        pairs = packed[:, :2 * self.m].astype(np.int64)
+        return pairs[:, 0::2] << 8 | pairs[:, 1::2]
+
+    def activated(self, packed_vector, radius):
+        """
+        Returns the sorted rows within radius of the packed vector, or None
+        when the buckets to check hold too many rows to beat a full scan.
+        """
+        limit = int(np.floor(radius)) // self.m
+        masks = self.masks.get(limit)
+        if masks is None:
+            masks = self.masks[limit] = np.flatnonzero(self.weights <= limit)
+        #Random addresses fill about len(masks) / 2^bits of the locations into each position's buckets:
+        if len(masks) * self.m > (1 << self.bits) * INDEX_SCAN_FRACTION:
+            return None
+        buckets = self.substrings(packed_vector)[0][:, None] ^ masks
+        firsts = np.take_along_axis(self.starts, buckets, axis=1).ravel()
+        counts = np.take_along_axis(self.starts, buckets + 1, axis=1).ravel() - firsts
+        total = int(counts.sum())
+        if total > self.p * INDEX_SCAN_FRACTION:
+            return None
+        #Gather every row of every bucket and check them exactly:
+        positions = np.arange(total) - np.repeat(np.cumsum(counts) - counts - firsts, counts)
+        candidates = np.unique(self.rows[positions])
+        return candidates[hamming_distances(self.packed_addresses[candidates], packed_vector) <= radius]
+
+
+
 #-----------------------FUNCTIONS-----------------------
 
 def plot(array, numColumns):
@@ -168,6 +497,37 @@ def hamming_distance(vector1, vector2):
     return distance
 
 
+def packed_width(n):
+    """
+    Function that returns the bytes taken by an n-bit vector packed by pack_bits.
+    """
+    return -(-n // 64) * 8
+
+
+def pack_bits(vectors):
+    """
+    Function that packs 0/1 vectors (the last axis) into bytes, padded
+    with zero bytes to a whole number of 64-bit words.
+    """
+    packed = np.packbits(np.asarray(vectors) == 1, axis=-1)
+    padding = -packed.shape[-1] % 8
+    if padding:
+        packed = np.concatenate([packed, np.zeros(packed.shape[:-1] + (padding,), dtype=np.uint8)], axis=-1)
+    return packed
+
+
+def hamming_distances(packed_vectors, packed_vector):
+    """
+    Function that computes the Hamming distance between one packed vector
+    and every row of a matrix of packed vectors.
+    """
+    #XOR leaves a set bit wherever the vectors differ; count them 64 bits at a time:
+    differences = np.bitwise_xor(packed_vectors, packed_vector)
+    if hasattr(np, 'bitwise_count'):
+        return np.bitwise_count(differences.view(np.uint64)).sum(axis=-1, dtype=np.int64)
+    return POPCOUNT[differences].sum(axis=-1, dtype=np.int64)
+
+
 def noisy_copy(array, probability):
     """
     This function returns a noisy copy of
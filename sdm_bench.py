@@ -0,0 +1,92 @@
+"""
+Benchmark for sdm.SDM: the bit-packed NumPy enter/lookup and the batched enter_batch/lookup_batch
+against the original per-address loops (enter_naive/lookup_naive), on the same addresses and patterns.
+Requirements: NumPy.
+Output: Seconds per pattern entered and looked up for each version, the speedup over the loops,
+        and whether the data arrays and retrieved vectors are identical (they should always be).
+        --skip-naive compares the batched version against enter/lookup instead, for sizes where
+        the loops would take too long.
+Example Usage (in terminal):
+---
+$python3 sdm_bench.py
+$python3 sdm_bench.py --locations 10000 --bits 1000 --patterns 20
+$python3 sdm_bench.py --locations 100000 --bits 1000 --patterns 2000 --skip-naive
+$python3 sdm_bench.py --locations 100000 --bits 256 --radius 0.1 --index-bits 16 --dtype int8 --skip-naive
+---
+"""
+import time
+import argparse
+import numpy as np
+import sdm
+
+
+#Runs enter on every pattern and then lookup on every probe; returns (seconds per enter,
+#seconds per lookup, retrieved vectors).
+def run(memory, enter, lookup, patterns, probes):
+    started = time.perf_counter()
+    for pattern in patterns:
+        enter(pattern)
+    entered = time.perf_counter()
+    retrieved = [lookup(probe) for probe in probes]
+    looked_up = time.perf_counter()
+    return (entered - started) / len(patterns), (looked_up - entered) / len(probes), retrieved
+
+
+#Same as run, but with one enter_batch and one lookup_batch call.
+def run_batch(memory, patterns, probes, batch_memory):
+    started = time.perf_counter()
+    memory.enter_batch(patterns, batch_memory)
+    entered = time.perf_counter()
+    retrieved = memory.lookup_batch(probes, batch_memory)
+    looked_up = time.perf_counter()
+    return (entered - started) / len(patterns), (looked_up - entered) / len(probes), list(retrieved)
+
+
+def main():
+
+    #Parse the command-line arguments:
+    parser = argparse.ArgumentParser(description="sdm.SDM benchmark: bit-packed NumPy vs per-address loops")
+    parser.add_argument('--locations', type=int, default=2000, help="Number of hard locations (p)")
+    parser.add_argument('--bits', type=int, default=256, help="Address length in bits (n)")
+    parser.add_argument('--patterns', type=int, default=5, help="Patterns entered and looked up")
+    parser.add_argument('--noise', type=float, default=0.1, help="Bit-flip probability of the probes")
+    parser.add_argument('--seed', type=int, default=0, help="Seed for addresses and patterns")
+    parser.add_argument('--batch-memory', type=int, default=sdm.BATCH_MEMORY, help="batch_memory for the batched version")
+    parser.add_argument('--skip-naive', action='store_true', help="Check against enter/lookup instead of the loops")
+    parser.add_argument('--dtype', choices=sdm.COUNTER_TYPES, default='float64', help="Counters of the numpy and batched SDMs")
+    parser.add_argument('--index-bits', type=int, choices=[8, 16], help="Give the numpy SDM an AddressIndex")
+    parser.add_argument('--radius', type=float, default=0.451, help="Radius as a fraction of the bits")
+    args = parser.parse_args()
+
+    memories = []
+    for version in range(2 if args.skip_naive else 3):
+        np.random.seed(args.seed)
+        memory = sdm.SDM(args.locations, args.bits, args.dtype if version < 2 else 'float64',
+                         index_bits=args.index_bits if version == 0 else None)
+        memory.radius = args.radius * args.bits
+        memories.append(memory)
+    patterns = np.random.randint(0, 2, (args.patterns, args.bits))
+    probes = np.array([sdm.noisy_copy(pattern, args.noise) for pattern in patterns])
+
+    results = []
+    if not args.skip_naive:
+        naive = memories.pop()
+        results.append(('naive', naive) + run(naive, naive.enter_naive, naive.lookup_naive, patterns, probes))
+    fast, batched = memories
+    results.append(('numpy', fast) + run(fast, fast.enter, fast.lookup, patterns, probes))
+    results.append(('batch', batched) + run_batch(batched, patterns, probes, args.batch_memory))
+
+    _, baseline, baseline_enter, baseline_lookup, expected = results[0]
+    print(f"SDM with {args.locations:,} locations of {args.bits} bits, {args.patterns} patterns\n")
+    print("{:>8} {:>14} {:>14} {:>14} {:>14}  {}".format(
+        "version", "enter (s)", "lookup (s)", "enter speedup", "lookup speedup", "output"))
+    print("-" * 84)
+    for name, memory, enter_time, lookup_time, retrieved in results:
+        identical = np.array_equal(baseline.data, memory.data) and all(map(np.array_equal, expected, retrieved))
+        print("{:>8} {:>14.6f} {:>14.6f} {:>13.0f}x {:>13.0f}x  {}".format(
+            name, enter_time, lookup_time, baseline_enter / enter_time, baseline_lookup / lookup_time,
+            "identical" if identical else "MISMATCH"))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,193 @@
+"""
+Local stand-in for the VirusTotal v2 file/report endpoint, used to test and benchmark
+HashScan.py without spending real API quota.
+Requirements: Only the Python standard library.
+Input: GET /vtapi/v2/file/report?apikey=<anything>&resource=<hash>[,<hash>...]
+Output: A VirusTotal-shaped JSON report per resource (a list when several are asked for).
+        Reports are derived from the hash itself, so the same hash always gets the same verdict.
+Example Usage (in terminal):
+---
+$python3 vt_stub_server.py --port 8765 --latency 50 --error-rate 0.01 --quota 600
+$python3 HashScan.py hashes.csv --api-url http://127.0.0.1:8765/vtapi/v2/file/report --rate 0
+---
+Options:
+    --latency / --jitter  -> milliseconds added to every response
+    --error-rate          -> fraction of requests answered with HTTP 500
+    --throttle-rate       -> fraction of requests answered as rate limited
+    --quota               -> requests allowed per minute before answering as rate limited (0 = no quota)
+    --limit-status        -> status used for rate limiting (VirusTotal v2 uses 204, some proxies 429)
+    --retry-after         -> seconds sent in the Retry-After header when rate limiting (0 = no header)
+"""
+import json
+import time
+import random
+import argparse
+import threading
+from collections import deque
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+REPORT_PATH = '/vtapi/v2/file/report'
+ENGINES = ['Bkav', 'ClamAV', 'DrWeb', 'ESET-NOD32', 'F-Secure', 'Kaspersky', 'McAfee', 'Microsoft',
+           'Panda', 'Sophos', 'Symantec', 'TrendMicro']
+
+
+#Builds the report for one resource. Roughly 1 in 8 hashes is "not found", the rest get
+#a positives count taken from the hash bits so verdicts are spread over all categories.
+def make_report(resource, not_found_rate=0.125):
+    resource = resource.strip().lower()
+    try:
+        seed = int(resource[:8], 16)
+    except ValueError:
+        seed = 0
+    if (seed % 1000) / 1000 < not_found_rate:
+        return {'response_code': 0, 'resource': resource,
+                'verbose_msg': 'The requested resource is not among the finished, queued or pending scans'}
+    total = len(ENGINES)
+    positives = (seed >> 10) % (total + 1)
+    scans = {engine: {'detected': i < positives, 'result': f"Trojan.Stub.{i}" if i < positives else None}
+             for i, engine in enumerate(ENGINES)}
+    return {'response_code': 1, 'resource': resource, 'scan_date': '2024-06-28 12:00:00',
+            'positives': positives, 'total': total, 'scans': scans,
+            'verbose_msg': 'Scan finished, information embedded'}
+
+
+#Counts of what the stub has answered.
+class StubStats:
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.resources = 0
+        self.served = 0
+        self.limited = 0
+        self.errors = 0
+
+
+class StubServer(ThreadingHTTPServer):
+
+    daemon_threads = True
+    request_queue_size = 128
+
+    def __init__(self, address, latency=0.0, jitter=0.0, error_rate=0.0, throttle_rate=0.0, quota=0,
+                 limit_status=204, max_resources=25, not_found_rate=0.125, retry_after=1):
+        super().__init__(address, StubHandler)
+        self.latency = latency / 1000
+        self.jitter = jitter / 1000
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.quota = quota
+        self.limit_status = limit_status
+        self.max_resources = max_resources
+        self.not_found_rate = not_found_rate
+        self.retry_after = retry_after
+        self.stats = StubStats()
+        self.window = deque()
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}{REPORT_PATH}"
+
+    #Sliding one-minute window of accepted requests, used for the per-minute quota.
+    def over_quota(self):
+        if not self.quota:
+            return False
+        with self.stats.lock:
+            now = time.monotonic()
+            while self.window and now - self.window[0] > 60:
+                self.window.popleft()
+            if len(self.window) >= self.quota:
+                return True
+            self.window.append(now)
+            return False
+
+
+class StubHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        server = self.server
+        url = urlparse(self.path)
+        if url.path.rstrip('/') != REPORT_PATH:
+            return self.reply(404, {'error': 'unknown endpoint'})
+        resources = [r for r in parse_qs(url.query).get('resource', [''])[0].split(',') if r.strip()]
+        if not resources:
+            return self.reply(400, {'error': 'missing resource'})
+
+        #Simulated network and processing time:
+        delay = server.latency + random.uniform(-server.jitter, server.jitter)
+        if delay > 0:
+            time.sleep(delay)
+
+        with server.stats.lock:
+            server.stats.requests += 1
+        if server.over_quota() or random.random() < server.throttle_rate:
+            with server.stats.lock:
+                server.stats.limited += 1
+            return self.reply(server.limit_status, None)
+        if random.random() < server.error_rate:
+            with server.stats.lock:
+                server.stats.errors += 1
+            return self.reply(500, {'error': 'simulated failure'})
+
+        reports = [make_report(r, server.not_found_rate) for r in resources[:server.max_resources]]
+        with server.stats.lock:
+            server.stats.served += 1
+            server.stats.resources += len(reports)
+        self.reply(200, reports if len(resources) > 1 else reports[0])
+
+    def reply(self, status, body):
+        data = json.dumps(body).encode() if body is not None else b''
+        self.send_response(status)
+        if status in (204, 429) and self.server.retry_after:
+            self.send_header('Retry-After', str(self.server.retry_after))
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+#Starts a stub server on a background thread and returns it. Use server.url as HashScan's api_url
+#and server.shutdown() when done. Port 0 picks a free port.
+def start_stub_server(host='127.0.0.1', port=0, **options):
+    server = StubServer((host, port), **options)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+
+def main():
+
+    #Parse the command-line arguments:
+    parser = argparse.ArgumentParser(description="Offline VirusTotal file/report stub server")
+    parser.add_argument('--host', default='127.0.0.1', help="Address to listen on")
+    parser.add_argument('--port', type=int, default=8765, help="Port to listen on")
+    parser.add_argument('--latency', type=float, default=0.0, help="Milliseconds added to every response")
+    parser.add_argument('--jitter', type=float, default=0.0, help="Random +/- milliseconds on top of the latency")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="Fraction of requests that fail with HTTP 500")
+    parser.add_argument('--throttle-rate', type=float, default=0.0, help="Fraction of requests answered as rate limited")
+    parser.add_argument('--quota', type=int, default=0, help="Requests allowed per minute (0 = no quota)")
+    parser.add_argument('--limit-status', type=int, default=204, choices=[204, 429], help="Status used when rate limiting")
+    parser.add_argument('--retry-after', type=int, default=1, help="Retry-After seconds sent when rate limiting (0 = none)")
+    parser.add_argument('--max-resources', type=int, default=25, help="Most resources answered per request")
+    args = parser.parse_args()
+
+    server = StubServer((args.host, args.port), latency=args.latency, jitter=args.jitter,
+                        error_rate=args.error_rate, throttle_rate=args.throttle_rate, quota=args.quota,
+                        limit_status=args.limit_status, max_resources=args.max_resources,
+                        retry_after=args.retry_after)
+    print(f"Serving VirusTotal stub on {server.url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("Exiting...")
+    finally:
+        stats = server.stats
+        print(f"{stats.requests} requests: {stats.served} served, {stats.limited} rate limited, {stats.errors} errors")
+
+
+if __name__ == '__main__':
+    main()